@@ -0,0 +1,76 @@
+"""Check :func:`roadaccidents.clustering.hdbscan` against scikit-learn.
+
+Clusters synthetic accidents with planted hotspots with both
+implementations and fails if the adjusted Rand index between the two
+labelings drops below ``--min-ari``::
+
+    python Code/benchmarks/hdbscan_sklearn.py
+    python Code/benchmarks/hdbscan_sklearn.py --points 4000 20000 100000
+
+The coordinates are jittered below the 1 m resolution so that neither
+implementation has to break ties between equal distances. Needs
+``scikit-learn``.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from roadaccidents import clustering, coords, synthetic  # noqa: E402
+
+POINTS = [4_000, 20_000]
+HOTSPOTS = 30
+
+
+def sample(n, seed=0):
+    """Synthetic accidents on a road grid, 15 % of them around ``HOTSPOTS`` centres."""
+    rng = np.random.default_rng(seed)
+    accidents = synthetic.accidents(n, synthetic.road_graph(100, 80.0), seed=seed + 1)
+    x, y = coords.lv95_xy(accidents)
+    x, y = np.array(x, dtype="float64"), np.array(y, dtype="float64")
+    hot = n * 3 // 20
+    centres = rng.uniform([2_641_000, 1_191_000], [2_647_000, 1_197_000], (HOTSPOTS, 2))
+    pick = rng.integers(0, HOTSPOTS, hot)
+    x[:hot] = np.round(centres[pick, 0] + rng.normal(0, 15, hot))
+    y[:hot] = np.round(centres[pick, 1] + rng.normal(0, 15, hot))
+    x += rng.uniform(-0.4, 0.4, n)
+    y += rng.uniform(-0.4, 0.4, n)
+    accidents[coords.LV95_E] = x
+    accidents[coords.LV95_N] = y
+    return accidents, np.column_stack([x, y])
+
+
+def check(n, min_cluster_size, min_ari):
+    from sklearn.cluster import HDBSCAN
+    from sklearn.metrics import adjusted_rand_score
+
+    accidents, X = sample(n)
+    start = time.perf_counter()
+    ours = clustering.hdbscan(accidents, min_cluster_size=min_cluster_size)
+    seconds = time.perf_counter() - start
+    theirs = HDBSCAN(min_cluster_size=min_cluster_size).fit(X).labels_
+    ari = adjusted_rand_score(ours, theirs)
+    ok = ari >= min_ari
+    print(f"{n:>9,}  clusters {ours.max() + 1:>5} / {theirs.max() + 1:<5}  ari {ari:6.3f}  "
+          f"{seconds:7.2f}s  {'ok' if ok else 'FAIL'}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, nargs="+", default=POINTS)
+    parser.add_argument("--min-cluster-size", type=int, default=20)
+    parser.add_argument("--min-ari", type=float, default=0.95)
+    args = parser.parse_args(argv)
+
+    results = [check(n, args.min_cluster_size, args.min_ari) for n in args.points]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
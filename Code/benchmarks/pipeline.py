@@ -0,0 +1,136 @@
+"""Benchmark the load -> project -> snap -> aggregate pipeline.
+
+Times every stage on synthetic data at several accident counts and graph
+sizes and writes the results to a JSON file, so that runs on different
+commits can be compared::
+
+    python Code/benchmarks/pipeline.py --points 10000 100000 --graphs city canton
+    python Code/benchmarks/pipeline.py --compare Code/benchmarks/results/old.json
+
+Each stage is run ``--repeat`` times and the fastest run is reported.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from roadaccidents import aggregate, coords, loader, synthetic  # noqa: E402
+from roadaccidents.snapping import snap  # noqa: E402
+
+POINTS = [10_000, 100_000, 1_000_000]
+GRAPHS = list(synthetic.GRAPH_SIZES)
+RESULTS = Path(__file__).resolve().parent / "results"
+
+
+def timed(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def row(stage, seconds, points=None, graph=None):
+    return {"stage": stage, "points": points, "graph": graph, "seconds": seconds}
+
+
+def bench_load(n, repeat, workdir):
+    df = synthetic.accidents(n, seed=n)
+    path = Path(workdir) / f"accidents-{n}.csv"
+    synthetic.write_astra_csv(df, path)
+    cache_dir = Path(workdir) / "cache"
+    cold, _ = timed(lambda: loader.load_accidents(path, use_cache=False), repeat)
+    loader.load_accidents(path, cache_dir=cache_dir)
+    warm, _ = timed(lambda: loader.load_accidents(path, cache_dir=cache_dir), repeat)
+    return [row("load_csv", cold, points=n), row("load_cache", warm, points=n)]
+
+
+def bench_graph(name, points, repeat):
+    graph = synthetic.road_graph(*synthetic.GRAPH_SIZES[name])
+    index_time, index = timed(graph.to_edge_index, 1)
+    rows = [row("build_index", index_time, graph=name)]
+    for n in points:
+        accidents = synthetic.accidents(n, graph, seed=n)
+        project, _ = timed(lambda: coords.transform(*coords.lv95_xy(accidents), coords.LV95, "EPSG:32632"), repeat)
+        snap_time, snapped = timed(lambda: snap(accidents, index), repeat)
+        edge = aggregate.accident_edges(snapped, accidents, index.edges)
+        agg_time, _ = timed(lambda: aggregate.edge_counts(edge, accidents, len(index)), repeat)
+        rows += [
+            row("project", project, points=n, graph=name),
+            row("snap", snap_time, points=n, graph=name),
+            row("aggregate", agg_time, points=n, graph=name),
+        ]
+        print(f"{name:>8} {n:>9,}  snap {snap_time:8.3f}s  aggregate {agg_time:8.3f}s", file=sys.stderr)
+    return rows
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(points, graphs, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in points:
+            results += bench_load(n, repeat, workdir)
+    for name in graphs:
+        results += bench_graph(name, points, repeat)
+    return {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(old, new):
+    """Print the ratio new/old for every stage present in both runs."""
+    key = lambda r: (r["stage"], r["points"], r["graph"])  # noqa: E731
+    before = {key(r): r["seconds"] for r in old["results"]}
+    print(f"{'stage':<12} {'graph':>8} {'points':>9} {'old':>9} {'new':>9} {'ratio':>6}")
+    for r in new["results"]:
+        if key(r) in before:
+            ratio = r["seconds"] / before[key(r)]
+            flag = "  <-- slower" if ratio > 1.2 else ""
+            print(f"{r['stage']:<12} {r['graph'] or '-':>8} {r['points'] or 0:>9,} "
+                  f"{before[key(r)]:9.3f} {r['seconds']:9.3f} {ratio:6.2f}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, nargs="+", default=POINTS)
+    parser.add_argument("--graphs", nargs="+", default=GRAPHS, choices=GRAPHS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, help="JSON file, default results/<commit>.json")
+    parser.add_argument("--compare", type=Path, help="earlier JSON result to compare against")
+    args = parser.parse_args(argv)
+
+    report = run(args.points, args.graphs, args.repeat)
+    output = args.output or RESULTS / f"{report['commit'] or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"wrote {output}", file=sys.stderr)
+    if args.compare:
+        compare(json.loads(args.compare.read_text()), report)
+
+
+if __name__ == "__main__":
+    main()
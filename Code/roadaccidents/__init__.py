@@ -0,0 +1,10 @@
+"""Building blocks for the analysis of the ASTRA road accident locations.
+
+The notebooks in ``Code/`` and the scripts in ``Keith/`` can use these modules
+instead of re-reading and re-projecting the raw CSV on every run.
+"""
+
+from .loader import load_accidents
+from .snapping import EdgeIndex, snap
+
+__all__ = ["EdgeIndex", "load_accidents", "snap"]
@@ -0,0 +1,99 @@
+"""Accident counts per road edge.
+
+``osm_merge1.py`` joined the edge GeoDataFrame to every accident and then
+grouped by ``(u, v, key)``, copying an edge geometry per accident only to
+collapse it again. Here every accident gets an integer edge id once
+(:func:`accident_edges`); all breakdowns are then ``np.bincount`` calls over
+``edge * n_categories + code`` and geometry is attached once per edge at
+the very end (:func:`to_geodataframe`).
+"""
+
+import numpy as np
+import pandas as pd
+
+from .loader import CATEGORIES, FLAGS
+
+BREAKDOWNS = ("AccidentSeverityCategory", "AccidentType", "AccidentYear")
+
+
+def accident_edges(snapped, accidents, edges):
+    """Return the edge row for every accident, ``-1`` if it was not snapped.
+
+    ``snapped`` is the result of :func:`~roadaccidents.snapping.snap` and
+    ``edges`` a table with ``u``, ``v`` and ``key`` columns, e.g.
+    ``EdgeIndex.edges`` or ``CSRGraph.edge_frame()``; its row order defines
+    the edge ids.
+    """
+    table = pd.MultiIndex.from_arrays([edges["u"].to_numpy(), edges["v"].to_numpy(), edges["key"].to_numpy()])
+    per_snap = table.get_indexer(
+        pd.MultiIndex.from_arrays([snapped["u"].to_numpy(), snapped["v"].to_numpy(), snapped["key"].to_numpy()])
+    )
+    lookup = pd.Series(per_snap, index=snapped.index)
+    return lookup.reindex(accidents["AccidentUID"].to_numpy()).fillna(-1).to_numpy("int64")
+
+
+def _codes(accidents, column):
+    values = accidents[column]
+    if column in CATEGORIES:
+        return values.cat.codes.to_numpy("int64"), list(values.cat.categories)
+    if column == "AccidentYear":
+        years = values.to_numpy("int64")
+        first = int(years.min()) if len(years) else 0
+        labels = list(range(first, int(years.max()) + 1)) if len(years) else []
+        return years - first, [f"y{year}" for year in labels]
+    raise ValueError(f"cannot break down by {column!r}")
+
+
+def _bincount2d(group, codes, n_groups, n_codes):
+    flat = np.bincount(group * n_codes + codes, minlength=n_groups * n_codes)
+    return flat.reshape(n_groups, n_codes)
+
+
+def group_counts(group, accidents, n_groups, mask=None, by=BREAKDOWNS, flags=FLAGS, name="group"):
+    """Count accidents per group id, in total and broken down by ``by`` and ``flags``.
+
+    ``group`` holds one id in ``range(n_groups)`` per accident, ``-1`` for
+    accidents that belong to no group; ``mask`` is an optional boolean
+    filter over the accidents (e.g. a year or a canton). The result has one
+    row per group id, with the category codes (``as1``, ``at8``,
+    ``y2020``, ...) and the flag names as columns.
+    """
+    keep = group >= 0
+    if mask is not None:
+        keep &= np.asarray(mask, dtype=bool)
+    group = group[keep]
+
+    columns = {"accidents": np.bincount(group, minlength=n_groups)}
+    for column in by:
+        codes, labels = _codes(accidents, column)
+        codes = codes[keep]
+        valid = codes >= 0
+        counts = _bincount2d(group[valid], codes[valid], n_groups, len(labels))
+        columns.update({label: counts[:, i] for i, label in enumerate(labels)})
+    for flag in flags:
+        weights = accidents[flag].to_numpy("bool")[keep]
+        columns[flag] = np.bincount(group, weights=weights, minlength=n_groups).astype("int64")
+    return pd.DataFrame(columns, index=pd.RangeIndex(n_groups, name=name))
+
+
+def edge_counts(edge, accidents, n_edges, mask=None, by=BREAKDOWNS, flags=FLAGS):
+    """Count accidents per edge; ``edge`` comes from :func:`accident_edges`."""
+    return group_counts(edge, accidents, n_edges, mask=mask, by=by, flags=flags, name="edge")
+
+
+def to_geodataframe(counts, edges, crs, geometries=None, min_accidents=1):
+    """Attach ``u``, ``v``, ``key`` and geometry to the edges with accidents.
+
+    ``geometries`` defaults to ``edges["geometry"]``; pass
+    ``CSRGraph.geometries`` to build them only for the selected edges.
+    """
+    import geopandas as gpd
+
+    rows = np.flatnonzero(counts["accidents"].to_numpy() >= min_accidents)
+    if geometries is None:
+        geometry = np.asarray(edges["geometry"].array, dtype=object)[rows]
+    else:
+        geometry = geometries(rows)
+    frame = edges[["u", "v", "key"]].iloc[rows].reset_index(drop=True)
+    frame = pd.concat([frame, counts.iloc[rows].reset_index()], axis=1)
+    return gpd.GeoDataFrame(frame, geometry=geometry, crs=crs)
@@ -0,0 +1,286 @@
+"""Compressed bitmap index over the categorical accident attributes.
+
+Compound filters like "fatal pedestrian accidents on principal roads in
+2020" are chained boolean masks over the whole table in the notebooks.
+:class:`BitmapIndex` keeps one bitmap of row ids per value of every
+indexed column, so such a filter becomes a few bitwise operations on small
+bitmaps.
+
+The bitmaps follow the Roaring layout: row ids are split into chunks of
+65536 by their upper 16 bits, and each chunk is stored either as a sorted
+``uint16`` array (up to 4096 rows) or as a 1024-word ``uint64`` bitmap.
+Sparse values such as ``as1`` cost two bytes per row, dense ones such as
+a year at most 8 KB per chunk. Run containers are left out; the ASTRA
+table is sorted by year, but that already makes the year bitmaps dense
+chunks.
+
+::
+
+    index = load_bitmap_index("RoadTrafficAccidentLocations.csv")
+    rows = index.rows(AccidentSeverityCategory="as1", AccidentInvolvingPedestrian=True,
+                      RoadType="rt432", AccidentYear=2020)
+"""
+
+import ast
+from pathlib import Path
+
+import numpy as np
+
+from .loader import CATEGORIES, FLAGS, cache_path, load_accidents
+
+CHUNK_BITS = 16
+ARRAY_LIMIT = 4096
+
+INDEXED = (
+    "AccidentSeverityCategory",
+    "AccidentType",
+    "RoadType",
+    "CantonCode",
+    "AccidentWeekDay",
+    "AccidentYear",
+    "AccidentMonth",
+    "AccidentHour",
+    *FLAGS,
+)
+
+
+def _popcount(words):
+    return int(np.bitwise_count(words).sum())
+
+
+def _to_words(low):
+    bits = np.zeros(1 << CHUNK_BITS, dtype=bool)
+    bits[low] = True
+    return np.packbits(bits, bitorder="little").view(np.uint64)
+
+
+def _to_low(words):
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder="little")).astype(np.uint16)
+
+
+def _contains(words, low):
+    low = low.astype(np.uint64)
+    return ((words[low >> np.uint64(6)] >> (low & np.uint64(63))) & np.uint64(1)).astype(bool)
+
+
+def _container(low=None, words=None):
+    """Return the compact container for a chunk, or None if it is empty."""
+    if words is not None:
+        n = _popcount(words)
+        if n == 0:
+            return None
+        return words if n > ARRAY_LIMIT else _to_low(words)
+    if len(low) == 0:
+        return None
+    return _to_words(low) if len(low) > ARRAY_LIMIT else low
+
+
+def _is_words(container):
+    return container.dtype == np.uint64
+
+
+class Bitmap:
+    """Set of row ids in Roaring layout; ``chunks`` maps the upper 16 bits to a container."""
+
+    def __init__(self, chunks=None):
+        self.chunks = chunks or {}
+
+    def __repr__(self):
+        return f"Bitmap({len(self)} rows in {len(self.chunks)} chunks)"
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from sorted, unique row ids."""
+        rows = np.asarray(rows, dtype=np.int64)
+        high = rows >> CHUNK_BITS
+        bounds = np.flatnonzero(np.r_[True, high[1:] != high[:-1], True]) if len(rows) else []
+        chunks = {}
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            chunks[int(high[start])] = _container(low=(rows[start:stop] & 0xFFFF).astype(np.uint16))
+        return cls(chunks)
+
+    @classmethod
+    def full(cls, n):
+        """Bitmap of all rows ``0 .. n - 1``."""
+        return cls.from_rows(np.arange(n))
+
+    def __len__(self):
+        return sum(_popcount(c) if _is_words(c) else len(c) for c in self.chunks.values())
+
+    def __and__(self, other):
+        chunks = {}
+        for key in self.chunks.keys() & other.chunks.keys():
+            a, b = self.chunks[key], other.chunks[key]
+            if _is_words(a) and _is_words(b):
+                c = _container(words=a & b)
+            elif _is_words(a):
+                c = _container(low=b[_contains(a, b)])
+            elif _is_words(b):
+                c = _container(low=a[_contains(b, a)])
+            else:
+                c = _container(low=np.intersect1d(a, b, assume_unique=True))
+            if c is not None:
+                chunks[key] = c
+        return Bitmap(chunks)
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for key, b in other.chunks.items():
+            a = chunks.get(key)
+            if a is None:
+                chunks[key] = b
+            elif _is_words(a) or _is_words(b):
+                words_a = a if _is_words(a) else _to_words(a)
+                words_b = b if _is_words(b) else _to_words(b)
+                chunks[key] = _container(words=words_a | words_b)
+            else:
+                chunks[key] = _container(low=np.union1d(a, b))
+        return Bitmap(chunks)
+
+    def __sub__(self, other):
+        chunks = {}
+        for key, a in self.chunks.items():
+            b = other.chunks.get(key)
+            if b is None:
+                c = a
+            elif _is_words(a):
+                words_b = b if _is_words(b) else _to_words(b)
+                c = _container(words=a & ~words_b)
+            elif _is_words(b):
+                c = _container(low=a[~_contains(b, a)])
+            else:
+                c = _container(low=np.setdiff1d(a, b, assume_unique=True))
+            if c is not None:
+                chunks[key] = c
+        return Bitmap(chunks)
+
+    def to_rows(self):
+        """Return the sorted row ids as ``int64``."""
+        parts = [
+            (key << CHUNK_BITS) + (_to_low(c) if _is_words(c) else c).astype(np.int64)
+            for key, c in sorted(self.chunks.items())
+        ]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def to_mask(self, n):
+        mask = np.zeros(n, dtype=bool)
+        mask[self.to_rows()] = True
+        return mask
+
+
+class BitmapIndex:
+    """One :class:`Bitmap` per value of every indexed column of the accident table."""
+
+    def __init__(self, bitmaps, n_rows):
+        self.bitmaps = bitmaps
+        self.n_rows = n_rows
+        self.universe = Bitmap.full(n_rows)
+
+    def __repr__(self):
+        columns = sorted({column for column, _ in self.bitmaps})
+        return f"BitmapIndex({self.n_rows} rows, {len(self.bitmaps)} bitmaps over {len(columns)} columns)"
+
+    @classmethod
+    def build(cls, accidents, columns=INDEXED):
+        bitmaps = {}
+        for column in columns:
+            values = accidents[column]
+            if column in FLAGS:
+                bitmaps[(column, True)] = Bitmap.from_rows(np.flatnonzero(values.to_numpy(bool)))
+                continue
+            if column in CATEGORIES:
+                codes = values.cat.codes.to_numpy("int64")
+                labels = list(values.cat.categories)
+            else:
+                codes, uniques = values.factorize(sort=True)
+                labels = [int(v) for v in uniques]
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+            for i, label in enumerate(labels):
+                if bounds[i + 1] > bounds[i]:
+                    bitmaps[(column, label)] = Bitmap.from_rows(order[bounds[i]:bounds[i + 1]])
+        return cls(bitmaps, len(accidents))
+
+    def bitmap(self, column, value):
+        """Bitmap of the rows where ``column == value`` (empty if there are none)."""
+        if column in FLAGS and not value:
+            return self.universe - self.bitmaps.get((column, True), Bitmap())
+        if not any(c == column for c, _ in self.bitmaps):
+            raise KeyError(f"{column!r} is not indexed")
+        allowed = CATEGORIES.get(column)
+        if allowed is not None and value not in allowed:
+            raise ValueError(f"unknown value {value!r} for {column}")
+        return self.bitmaps.get((column, value), Bitmap())
+
+    def select(self, **filters):
+        """AND over the columns, OR over the values given per column.
+
+        ``index.select(RoadType=["rt430", "rt431"], AccidentYear=2020)``
+        """
+        result = self.universe
+        # smallest bitmaps first keeps the intermediate results small
+        terms = []
+        for column, wanted in filters.items():
+            wanted = wanted if isinstance(wanted, (list, tuple, set, range, np.ndarray)) else [wanted]
+            term = Bitmap()
+            for value in wanted:
+                term = term | self.bitmap(column, value)
+            terms.append(term)
+        for term in sorted(terms, key=len):
+            result = result & term
+            if not result.chunks:
+                break
+        return result
+
+    def rows(self, **filters):
+        """Row positions (for ``accidents.iloc`` / ``take``) matching ``filters``."""
+        return self.select(**filters).to_rows()
+
+    def count(self, **filters):
+        return len(self.select(**filters))
+
+    def mask(self, **filters):
+        """Boolean mask over the rows, e.g. for the ``mask`` of :func:`~roadaccidents.aggregate.group_counts`."""
+        return self.select(**filters).to_mask(self.n_rows)
+
+    def save(self, path):
+        """Write all containers into one ``.npz`` file."""
+        arrays = {"n_rows": np.array(self.n_rows)}
+        keys = []
+        for i, ((column, value), bitmap) in enumerate(self.bitmaps.items()):
+            keys.append((column, value))
+            for chunk, container in bitmap.chunks.items():
+                arrays[f"{i}/{chunk}"] = container
+        arrays["keys"] = np.array([repr(key) for key in keys])
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            keys = [ast.literal_eval(key) for key in f["keys"]]
+            bitmaps = {key: Bitmap() for key in keys}
+            for name in f.files:
+                if "/" in name:
+                    i, chunk = name.split("/")
+                    bitmaps[keys[int(i)]].chunks[int(chunk)] = f[name]
+            n_rows = int(f["n_rows"])
+        return cls(bitmaps, n_rows)
+
+
+def load_bitmap_index(path="RoadTrafficAccidentLocations.csv", cache_dir=None):
+    """Load the bitmap index for the CSV at ``path``, building and caching it on first use.
+
+    Row ids refer to the rows of :func:`~roadaccidents.loader.load_accidents`.
+    """
+    accidents_cache = cache_path(path, (), cache_dir)
+    target = accidents_cache.with_name(accidents_cache.stem + "-bitmaps.npz")
+    if target.exists():
+        return BitmapIndex.load(target)
+    index = BitmapIndex.build(load_accidents(path, cache_dir=cache_dir))
+    index.save(target)
+    return index
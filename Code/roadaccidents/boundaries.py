@@ -0,0 +1,169 @@
+"""Canton, district and municipality of every accident.
+
+``Geodatenhandling 1.py`` assigns points to cantons with
+``gpd.sjoin(..., predicate="within")``, and every analysis would have to
+repeat that join. Here the boundary polygons (swissBOUNDARIES3D or the
+generalised BFS ``g1k17``/``g1b17``/``g1g17`` shapefiles) are read once,
+parts with the same number are merged, and one STRtree query against the
+prepared polygons assigns all accidents at a time. The result is cached next to the typed accident
+cache, keyed on the hashes of the boundary files, so later runs only read
+one small Parquet file.
+
+::
+
+    admin = load_admin(boundaries={
+        "canton": "swissBOUNDARIES3D_1_5_TLM_KANTONSGEBIET.shp",
+        "district": "swissBOUNDARIES3D_1_5_TLM_BEZIRKSGEBIET.shp",
+        "municipality": "swissBOUNDARIES3D_1_5_TLM_HOHEITSGEBIET.shp",
+    })
+"""
+
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from . import coords
+from .loader import cache_path, file_digest, load_accidents
+
+LEVELS = ("canton", "district", "municipality")
+
+# number and name columns per level: swissBOUNDARIES3D first, then the BFS g1k17 files
+COLUMNS = {
+    "canton": (("KANTONSNUM", "KTNR"), ("NAME", "KTNAME")),
+    "district": (("BEZIRKSNUM", "BZNR"), ("NAME", "BZNAME")),
+    "municipality": (("BFS_NUMMER", "GMDNR"), ("NAME", "GMDNAME")),
+}
+
+# generalised boundaries cut off some border roads; points outside every polygon go to the
+# nearest one within this distance (metres)
+SNAP_DISTANCE = 200.0
+
+
+def _pick(columns, candidates, level, what):
+    for column in candidates:
+        if column in columns:
+            return column
+    raise KeyError(f"no {what} column for {level!r} boundaries, expected one of {candidates}")
+
+
+def read_boundaries(path, level, layer=None, id_column=None, name_column=None, crs=coords.LV95):
+    """Read the boundaries of ``level`` as a GeoDataFrame indexed by their number.
+
+    The columns are ``name`` and ``geometry`` (2-D, in ``crs``); polygons
+    with the same number (exclaves, lake parts) are merged. Needs
+    ``geopandas``.
+    """
+    import geopandas as gpd
+
+    if level not in LEVELS:
+        raise ValueError(f"level must be one of {LEVELS}, not {level!r}")
+    gdf = gpd.read_file(path, layer=layer, encoding="utf-8").to_crs(crs)
+    id_column = id_column or _pick(gdf.columns, COLUMNS[level][0], level, "number")
+    name_column = name_column or _pick(gdf.columns, COLUMNS[level][1], level, "name")
+
+    gdf = gpd.GeoDataFrame(
+        {level: gdf[id_column].to_numpy("int64"), "name": gdf[name_column].to_numpy(object)},
+        geometry=shapely.force_2d(np.asarray(gdf.geometry.array, dtype=object)),
+        crs=crs,
+    )
+    return gdf.dissolve(by=level, aggfunc="first").sort_index()
+
+
+def assign(x, y, boundaries, snap_distance=SNAP_DISTANCE):
+    """Return the number of the boundary polygon containing each point (``<NA>`` if none).
+
+    Points on a shared border go to the polygon listed first; points
+    outside every polygon go to the nearest one within ``snap_distance``.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    geometry = np.asarray(boundaries.geometry.array, dtype=object)
+    points = shapely.points(x, y)
+    item = np.full(len(points), -1, dtype="int64")
+
+    # candidates by bounding box from a tree over the points, then the exact test against the
+    # prepared polygons; querying a polygon tree with the points would test unprepared polygons
+    shapely.prepare(geometry)
+    polygon, point = shapely.STRtree(points).query(geometry)
+    inside = shapely.intersects_xy(geometry[polygon], x[point], y[point])
+    polygon, point = polygon[inside], point[inside]
+    order = np.lexsort((polygon, point))
+    point, polygon = point[order], polygon[order]
+    first = np.r_[True, point[1:] != point[:-1]] if len(point) else np.empty(0, dtype=bool)
+    item[point[first]] = polygon[first]
+
+    outside = np.flatnonzero((item < 0) & np.isfinite(x) & np.isfinite(y))
+    if len(outside) and snap_distance:
+        polygon, point = shapely.STRtree(points[outside]).query(geometry, predicate="dwithin", distance=snap_distance)
+        distance = shapely.distance(geometry[polygon], points[outside][point])
+        order = np.lexsort((polygon, distance, point))
+        point, polygon = point[order], polygon[order]
+        first = np.r_[True, point[1:] != point[:-1]] if len(point) else np.empty(0, dtype=bool)
+        item[outside[point[first]]] = polygon[first]
+
+    ids = pd.array(boundaries.index.to_numpy("int64"), dtype="Int32")
+    return ids.take(item, allow_fill=True)
+
+
+def assign_accidents(accidents, boundaries, snap_distance=SNAP_DISTANCE):
+    """Assign ``accidents`` to every level in ``boundaries`` (level -> GeoDataFrame from :func:`read_boundaries`).
+
+    Returns a DataFrame indexed by ``AccidentUID`` with one ``Int32``
+    column per level, in the row order of ``accidents``.
+    """
+    x, y = coords.lv95_xy(accidents)
+    columns = {}
+    for level in LEVELS:
+        if level in boundaries:
+            gdf = boundaries[level]
+            if gdf.crs is not None and gdf.crs != coords.LV95:
+                gdf = gdf.to_crs(coords.LV95)
+            columns[level] = assign(x, y, gdf, snap_distance)
+    return pd.DataFrame(columns, index=pd.Index(accidents["AccidentUID"].to_numpy(), name="AccidentUID"))
+
+
+def _source(spec):
+    """``path`` or ``(path, layer)`` -> (path, layer)."""
+    return (spec, None) if isinstance(spec, (str, Path)) else tuple(spec)
+
+
+def admin_cache_path(path, boundaries, cache_dir=None):
+    """Cache file of the assignment, keyed on the accident CSV and the boundary files."""
+    digest = hashlib.sha1()
+    for level in LEVELS:
+        if level in boundaries:
+            source, layer = _source(boundaries[level])
+            digest.update(f"{level}:{layer}:{file_digest(source)};".encode())
+    accidents_cache = cache_path(path, (), cache_dir)
+    return accidents_cache.with_name(f"{accidents_cache.stem}-admin-{digest.hexdigest()[:16]}.parquet")
+
+
+def load_admin(path="RoadTrafficAccidentLocations.csv", boundaries=None, cache_dir=None):
+    """Load the canton/district/municipality numbers per accident, assigning and caching them on first use.
+
+    ``boundaries`` maps each level to a boundary file, or to a
+    ``(file, layer)`` pair for a GeoPackage. The rows follow
+    :func:`~roadaccidents.loader.load_accidents`.
+    """
+    if not boundaries:
+        raise ValueError("boundaries must name at least one boundary file")
+    unknown = set(boundaries) - set(LEVELS)
+    if unknown:
+        raise ValueError(f"unknown levels: {sorted(unknown)}")
+    target = admin_cache_path(path, boundaries, cache_dir)
+    if target.exists():
+        return pd.read_parquet(target)
+
+    polygons = {}
+    for level, spec in boundaries.items():
+        source, layer = _source(spec)
+        polygons[level] = read_boundaries(source, level, layer=layer)
+    admin = assign_accidents(load_accidents(path, cache_dir=cache_dir), polygons)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(".tmp")
+    admin.to_parquet(tmp)
+    tmp.replace(target)
+    return admin
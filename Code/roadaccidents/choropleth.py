@@ -0,0 +1,152 @@
+"""Accidents per canton, district and municipality, normalised for choropleth maps.
+
+``Geodatenhandling 1.py`` builds choropleths with ``value_counts()``,
+``to_frame()`` and a ``merge`` onto the canton polygons, and notes that the
+canton counts mostly mirror the population. :func:`choropleth` returns the
+counts per boundary together with accidents per 100,000 inhabitants and
+per road km, both per year.
+
+The counts come from a :class:`~roadaccidents.cube.Cube` that has the
+boundary numbers of :mod:`roadaccidents.boundaries` as extra dimensions.
+It is cached next to the assignment, so a map for any filter on the
+accident attributes is a cube query and never reads the accident table.
+
+::
+
+    cube = load_admin_cube(boundaries=files)
+    polygons = read_boundaries(files["district"], "district")
+    km = road_km(graph, polygons)
+    table = choropleth(cube, "district", polygons, population=population, km=km,
+                       AccidentSeverityCategory=["as1", "as2"])
+    table.plot(column="per_100k", legend=True)
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from .boundaries import LEVELS, admin_cache_path, assign, load_admin
+from .cube import DIMENSIONS, Cube
+from .loader import load_accidents
+
+PER_CAPITA = 100_000
+
+
+def build_admin_cube(accidents, admin, dimensions=DIMENSIONS):
+    """Count ``accidents`` over ``dimensions`` and the boundary levels in ``admin``.
+
+    ``admin`` is the assignment from :func:`~roadaccidents.boundaries.load_admin`.
+    """
+    levels = [level for level in LEVELS if level in admin]
+    frame = accidents[list(dimensions)].copy()
+    for level in levels:
+        frame[level] = admin[level].to_numpy()
+    return Cube.build(frame, [*dimensions, *levels])
+
+
+def load_admin_cube(path="RoadTrafficAccidentLocations.csv", boundaries=None, cache_dir=None, dimensions=DIMENSIONS):
+    """Load the cube with boundary dimensions, building and caching it on first use.
+
+    ``boundaries`` is passed on to :func:`~roadaccidents.boundaries.load_admin`;
+    the cube is keyed on the same hashes as the assignment.
+    """
+    target = admin_cache_path(path, boundaries or {}, cache_dir)
+    target = target.with_name(target.stem + "-cube.parquet")
+    levels = [level for level in LEVELS if level in (boundaries or {})]
+    if target.exists():
+        cube = Cube.load(target)
+        if cube.dimensions == [*dimensions, *levels]:
+            return cube
+    admin = load_admin(path, boundaries, cache_dir)
+    cube = build_admin_cube(load_accidents(path, cache_dir=cache_dir), admin, dimensions)
+    cube.save(target)
+    return cube
+
+
+def read_population(path, id_column, population_column, **kwargs):
+    """Read a BFS population table (CSV, or Excel by extension) as a Series indexed by the boundary number."""
+    path = str(path)
+    reader = pd.read_excel if path.endswith((".xls", ".xlsx")) else pd.read_csv
+    table = reader(path, **kwargs)
+    table = table.dropna(subset=[id_column, population_column])
+    return pd.Series(
+        table[population_column].to_numpy("float64"),
+        index=pd.Index(table[id_column].to_numpy("int64")),
+        name="population",
+    )
+
+
+def rollup_population(population, municipalities, boundaries):
+    """Sum municipal ``population`` into the polygons of ``boundaries`` (e.g. districts or cantons).
+
+    Every municipality (GeoDataFrame indexed by number, e.g. from
+    :func:`~roadaccidents.boundaries.read_boundaries`) is placed by a point
+    on its surface.
+    """
+    municipalities = municipalities.to_crs(boundaries.crs) if boundaries.crs is not None else municipalities
+    inside = shapely.point_on_surface(np.asarray(municipalities.geometry.array, dtype=object))
+    parent = assign(shapely.get_x(inside), shapely.get_y(inside), boundaries)
+    values = population.reindex(municipalities.index).to_numpy("float64")
+    frame = pd.DataFrame({"parent": parent, "population": values}).dropna()
+    total = frame.groupby("parent")["population"].sum()
+    return total.reindex(boundaries.index, fill_value=0).rename("population")
+
+
+def road_km(graph, boundaries):
+    """Road length in km per polygon of ``boundaries``.
+
+    Every street is counted once, even if it is stored as two directed
+    edges, and goes to the polygon containing its midpoint.
+    """
+    u = np.asarray(graph.u, dtype="int64")
+    v = np.asarray(graph.v, dtype="int64")
+    length = np.asarray(graph.length, dtype="float64")
+    key = pd.DataFrame({"a": np.minimum(u, v), "b": np.maximum(u, v), "length": length.round(1)})
+    edges = np.flatnonzero(~key.duplicated().to_numpy())
+    mid = shapely.line_interpolate_point(graph.geometries(edges), 0.5, normalized=True)
+    gdf = boundaries.to_crs(graph.crs) if boundaries.crs is not None else boundaries
+    polygon = assign(shapely.get_x(mid), shapely.get_y(mid), gdf, snap_distance=0)
+    km = pd.Series(length[edges] / 1000).groupby(polygon.to_numpy(dtype="float64", na_value=np.nan)).sum()
+    km.index = km.index.astype("int64")
+    return km.reindex(boundaries.index, fill_value=0.0).rename("km")
+
+
+def _years(cube, filters):
+    years = filters.get("AccidentYear", cube.labels["AccidentYear"])
+    years = years if isinstance(years, (list, tuple, set, np.ndarray, range)) else [years]
+    return len([year for year in years if year is not None])
+
+
+def choropleth(cube, level, boundaries=None, population=None, km=None, **filters):
+    """Accidents per polygon of ``level`` matching ``filters``, with rates per year.
+
+    ``filters`` select on the cube dimensions as in
+    :meth:`~roadaccidents.cube.Cube.query`. ``population`` and ``km`` are
+    Series indexed by the boundary number; with them the result has
+    ``per_100k`` (accidents per 100,000 inhabitants and year) and
+    ``per_km`` (accidents per road km and year). With ``boundaries`` the
+    result is a GeoDataFrame ready for ``.plot(column=...)``; accidents
+    outside every polygon are left out.
+    """
+    if level not in cube.labels:
+        raise KeyError(f"the cube has no {level!r} dimension")
+    counts = cube.query(level, complete=True, **filters)
+    counts = counts[counts.index.notna()]
+    counts.index = pd.Index(counts.index.astype("int64"), name=level)
+    index = boundaries.index if boundaries is not None else counts.index
+    table = pd.DataFrame({"accidents": counts.reindex(index, fill_value=0).to_numpy()}, index=index)
+
+    years = max(_years(cube, filters), 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if population is not None:
+            table["population"] = population.reindex(index).to_numpy("float64")
+            table["per_100k"] = (table["accidents"] / table["population"] / years * PER_CAPITA).where(
+                table["population"] > 0
+            )
+        if km is not None:
+            table["km"] = km.reindex(index).to_numpy("float64")
+            table["per_km"] = (table["accidents"] / table["km"] / years).where(table["km"] > 0)
+    if boundaries is not None:
+        table = boundaries.join(table)
+    table.attrs["years"] = years
+    return table
@@ -0,0 +1,376 @@
+"""Spatial and spatio-temporal clustering of the accident points.
+
+DBSCAN and HDBSCAN over the LV95 coordinates, optionally extended by
+``AccidentYear``, ``AccidentMonth`` and ``AccidentHour``. ``time_scale``
+converts one unit of a time column into metres, e.g.
+``{"AccidentYear": 200}`` makes one year count like 200 m. Month and hour
+wrap around (December is next to January, 23h next to 0h).
+
+Many accidents share the exact same coordinates, so identical feature rows
+are collapsed into one weighted point first. All neighbour queries run on
+a ``scipy.spatial.cKDTree`` over these distinct points, which keeps the
+full ten years within seconds.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components, minimum_spanning_tree
+from scipy.spatial import cKDTree
+
+from . import coords
+from .aggregate import group_counts
+
+TIME_COLUMNS = ("AccidentYear", "AccidentMonth", "AccidentHour")
+
+# cyclic time columns: (first value, period)
+PERIODS = {"AccidentMonth": (1, 12), "AccidentHour": (0, 24)}
+
+# distances below this (metres) are treated as equal; the ASTRA coordinates are rounded to 1 m
+RESOLUTION = 1.0
+
+
+def features(accidents, time_scale=None):
+    """Return the feature matrix, the per-column period for the KD-tree and a validity mask.
+
+    Rows with a missing value in one of the time columns are not valid.
+    """
+    x, y = coords.lv95_xy(accidents)
+    columns = [np.asarray(x, dtype="float64"), np.asarray(y, dtype="float64")]
+    boxsize = [0.0, 0.0]
+    valid = np.ones(len(accidents), dtype=bool)
+    for col, scale in (time_scale or {}).items():
+        if col not in TIME_COLUMNS:
+            raise ValueError(f"unknown time column {col!r}, expected one of {TIME_COLUMNS}")
+        values = pd.to_numeric(accidents[col]).astype("float64").to_numpy(na_value=np.nan)
+        valid &= ~np.isnan(values)
+        if col in PERIODS:
+            first, period = PERIODS[col]
+            columns.append(np.mod(values - first, period) * scale)
+            boxsize.append(period * scale)
+        else:
+            columns.append(values * scale)
+            boxsize.append(0.0)
+    X = np.column_stack(columns)
+    X[~valid] = 0
+    return X, np.array(boxsize), valid
+
+
+def _distinct(X, valid):
+    """Collapse identical rows; return the distinct points, their weight and the row -> point map."""
+    points, inverse, weight = np.unique(X[valid], axis=0, return_inverse=True, return_counts=True)
+    return points, weight.astype("float64"), inverse.ravel()
+
+
+def _expand(point_labels, inverse, valid):
+    labels = np.full(len(valid), -1, dtype="int64")
+    labels[valid] = point_labels[inverse]
+    return labels
+
+
+def _relabel(labels):
+    """Number the clusters 0, 1, ... in order of decreasing size."""
+    ids, counts = np.unique(labels[labels >= 0], return_counts=True)
+    order = np.argsort(-counts, kind="stable")
+    table = np.full(labels.max() + 2 if len(labels) else 1, -1, dtype="int64")
+    table[ids[order]] = np.arange(len(ids))
+    return table[labels]
+
+
+def dbscan(accidents, eps=50.0, min_samples=10, time_scale=None):
+    """DBSCAN cluster id per accident (``-1`` for noise).
+
+    A point is a core point if at least ``min_samples`` accidents
+    (including itself) lie within ``eps``. Border points go to the cluster
+    of their nearest core point, so the result does not depend on the row
+    order.
+    """
+    X, boxsize, valid = features(accidents, time_scale)
+    points, weight, inverse = _distinct(X, valid)
+    n = len(points)
+    if n == 0:
+        return np.full(len(accidents), -1, dtype="int64")
+    tree = cKDTree(points, boxsize=boxsize if boxsize.any() else None)
+    pairs = tree.query_pairs(eps, output_type="ndarray")
+    i, j = pairs[:, 0], pairs[:, 1]
+    neighbours = (
+        weight + np.bincount(i, weights=weight[j], minlength=n) + np.bincount(j, weights=weight[i], minlength=n)
+    )
+    core = neighbours >= min_samples
+
+    both = core[i] & core[j]
+    links = sparse.coo_matrix((np.ones(both.sum()), (i[both], j[both])), shape=(n, n))
+    _, component = connected_components(links, directed=False)
+    point_labels = np.where(core, component, -1)
+
+    # border points: nearest core point within eps
+    a = np.concatenate([i, j])
+    b = np.concatenate([j, i])
+    border = ~core[a] & core[b]
+    a, b = a[border], b[border]
+    if len(a):
+        delta = np.abs(points[a] - points[b])
+        if boxsize.any():
+            periodic = boxsize > 0
+            delta[:, periodic] = np.minimum(delta[:, periodic], boxsize[periodic] - delta[:, periodic])
+        dist = np.hypot.reduce(delta, axis=1) if delta.shape[1] > 1 else delta[:, 0]
+        order = np.lexsort((b, dist, a))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = a[order][1:] != a[order][:-1]
+        point_labels[a[order][first]] = component[b[order][first]]
+    return _relabel(_expand(point_labels, inverse, valid))
+
+
+def _core_distance(tree, points, weight, min_samples):
+    k = min(int(min_samples), len(points))
+    dist, idx = tree.query(points, k=k)
+    dist, idx = dist.reshape(len(points), k), idx.reshape(len(points), k)
+    cumulative = np.cumsum(weight[idx], axis=1)
+    # first neighbour at which the accumulated accidents reach min_samples
+    reached = np.minimum(np.argmax(cumulative >= min_samples, axis=1), k - 1)
+    return dist[np.arange(len(points)), reached]
+
+
+def _closest_outside(query, rows, component, core, best, best_a, best_b, k, max_k):
+    """Lower ``best`` per component to the closest mutual reachability to another component.
+
+    ``query(rows, k)`` returns the ``k`` nearest neighbours of ``rows``. A
+    row is done once no neighbour farther away can beat the best edge of
+    its component; the rows still open when ``k`` reaches ``max_k`` are
+    returned.
+    """
+    while len(rows):
+        dist, idx = query(rows, k)
+        dist, idx = dist.reshape(len(rows), -1), idx.reshape(len(rows), -1)
+        found = idx < len(component)
+        idx = np.where(found, idx, 0)
+        outside = found & (component[idx] != component[rows][:, None])
+        reach = np.maximum(np.maximum(dist, core[rows][:, None]), core[idx])
+        reach = np.where(outside, reach, np.inf)
+        j = reach.argmin(axis=1)
+        reach, partner = reach[np.arange(len(rows)), j], idx[np.arange(len(rows)), j]
+
+        # best edge per component, ties to the lowest point pair
+        order = np.lexsort((partner, rows, reach, component[rows]))
+        comp = component[rows][order]
+        first = np.r_[True, comp[1:] != comp[:-1]]
+        for c, d, p, q in zip(comp[first], reach[order][first], rows[order][first], partner[order][first]):
+            if d < best[c] or (d == best[c] and (p, q) < (best_a[c], best_b[c])):
+                best[c], best_a[c], best_b[c] = d, p, q
+
+        # neighbours beyond the k-th are at least this far away
+        bound = np.maximum(np.where(found[:, -1], dist[:, -1], np.inf), core[rows])
+        rows = rows[bound < best[component[rows]]]
+        if k >= max_k:
+            break
+        k = min(2 * k, max_k)
+    return rows
+
+
+def _connect(tree, points, core, boxsize, component, k=32, max_k=512):
+    """Shortest mutual reachability edge from every component to any other one (Borůvka step).
+
+    The largest component is skipped; by the cut property each of the
+    other edges belongs to the minimum spanning tree. Rows that need more
+    than ``max_k`` neighbours are searched in a tree over the other
+    components only.
+    """
+    n = len(points)
+    sizes = np.bincount(component)
+    best = np.full(len(sizes), np.inf)
+    best_a = np.full(len(sizes), n, dtype="int64")
+    best_b = np.full(len(sizes), n, dtype="int64")
+    rows = np.flatnonzero(component != sizes.argmax())
+    rows = _closest_outside(
+        lambda r, k: tree.query(points[r], k=k), rows, component, core, best, best_a, best_b, min(k, n), min(max_k, n)
+    )
+    for c in np.unique(component[rows]):
+        others = np.flatnonzero(component != c)
+        outside = cKDTree(points[others], boxsize=boxsize)
+
+        def query(r, k):
+            dist, idx = outside.query(points[r], k=k)
+            return dist, np.where(idx < len(others), others[np.minimum(idx, len(others) - 1)], n)
+
+        open_rows = rows[component[rows] == c]
+        _closest_outside(query, open_rows, component, core, best, best_a, best_b, min(k, len(others)), len(others))
+    keep = np.isfinite(best)
+    a, b = np.minimum(best_a[keep], best_b[keep]), np.maximum(best_a[keep], best_b[keep])
+    # two components may pick the same edge
+    _, first = np.unique(a * n + b, return_index=True)
+    return a[first], b[first], best[keep][first]
+
+
+def _spanning_tree(tree, points, core, boxsize, rows, cols, reach):
+    """Minimum spanning tree of the mutual reachability edges, joined into a single tree."""
+    n = len(points)
+    while True:
+        # explicit zeros would be dropped as missing edges
+        graph = sparse.coo_matrix((np.maximum(reach, RESOLUTION), (rows, cols)), shape=(n, n)).tocsr()
+        mst = minimum_spanning_tree(graph.maximum(graph.T)).tocoo()
+        n_components, component = connected_components(mst, directed=False)
+        if n_components == 1:
+            return mst
+        a, b, d = _connect(tree, points, core, boxsize, component)
+        rows, cols, reach = np.r_[mst.row, a], np.r_[mst.col, b], np.r_[mst.data, d]
+
+
+def _condense(n, weight, a, b, dist, min_cluster_size):
+    """Run the HDBSCAN condensation over the MST edges; return a label per point.
+
+    Edges are merged in order of increasing distance (union-find). A
+    component becomes a cluster once it holds ``min_cluster_size``
+    accidents; when two clusters meet, both end and a parent cluster
+    starts. Stabilities are accumulated on the way and the clusters are
+    selected by excess of mass.
+    """
+    parent = list(range(n))
+    size = weight.tolist()
+    cluster = [-1] * n  # cluster of each component root, -1 while too small
+    members = [[p] for p in range(n)]
+    owner = np.full(n, -1, dtype="int64")
+
+    sum_lambda, cluster_size, birth, children = [], [], [], []
+
+    def new_cluster(lam, points, total):
+        sum_lambda.append(total * lam)
+        cluster_size.append(total)
+        birth.append(0.0)
+        children.append([])
+        owner[points] = len(sum_lambda) - 1
+        return len(sum_lambda) - 1
+
+    def find(p):
+        root = p
+        while parent[root] != root:
+            root = parent[root]
+        while parent[p] != root:
+            parent[p], p = root, parent[p]
+        return root
+
+    for p in range(n):
+        if size[p] >= min_cluster_size:
+            cluster[p] = new_cluster(1 / RESOLUTION, [p], size[p])
+            members[p] = None
+
+    for u, v, d in zip(a.tolist(), b.tolist(), dist.tolist()):
+        ru, rv = find(u), find(v)
+        if ru == rv:
+            continue
+        lam = 1 / max(d, RESOLUTION)
+        cu, cv = cluster[ru], cluster[rv]
+        if size[ru] < size[rv]:
+            ru, rv, cu, cv = rv, ru, cv, cu
+        parent[rv] = ru
+        total = size[ru] + size[rv]
+        if cu >= 0 and cv >= 0:
+            for c in (cu, cv):
+                birth[c] = lam
+            merged = new_cluster(lam, [], total)
+            children[merged] = [cu, cv]
+            cluster[ru] = merged
+        elif cu >= 0 or cv >= 0:
+            c = cu if cu >= 0 else cv
+            small = rv if cu >= 0 else ru
+            sum_lambda[c] += size[small] * lam
+            cluster_size[c] += size[small]
+            owner[members[small]] = c
+            members[ru] = None
+            cluster[ru] = c
+        elif total >= min_cluster_size:
+            cluster[ru] = new_cluster(lam, members[ru] + members[rv], total)
+            members[ru] = None
+        else:
+            members[ru] = members[ru] + members[rv]
+        members[rv] = None
+        size[ru] = total
+
+    # clusters at the top of their tree start at lambda 0
+    n_clusters = len(sum_lambda)
+    stability = np.array(sum_lambda) - np.array(cluster_size) * np.array(birth)
+    best = stability.copy()
+    for c in range(n_clusters):
+        if children[c]:
+            below = sum(best[k] for k in children[c])
+            best[c] = max(stability[c], below)
+
+    # top-down: keep a cluster if it beats the best selection below it
+    label = np.full(n_clusters, -1, dtype="int64")
+    selected = np.zeros(n_clusters, dtype=bool)
+    has_parent = np.zeros(n_clusters, dtype=bool)
+    for c in range(n_clusters):
+        for k in children[c]:
+            has_parent[k] = True
+    roots = [c for c in range(n_clusters) if not has_parent[c]]
+    # a single root spanning all points is never a cluster of its own
+    stack = children[roots[0]] if len(roots) == 1 else roots
+    stack = list(stack)
+    while stack:
+        c = stack.pop()
+        if not children[c] or stability[c] >= best[c]:
+            selected[c] = True
+        else:
+            stack.extend(children[c])
+    for c in range(n_clusters - 1, -1, -1):
+        if selected[c]:
+            label[c] = c
+        for k in children[c]:
+            if label[k] < 0:
+                label[k] = label[c]
+    return np.where(owner >= 0, label[np.maximum(owner, 0)], -1)
+
+
+def hdbscan(accidents, min_cluster_size=20, min_samples=None, time_scale=None, n_neighbors=16):
+    """HDBSCAN cluster id per accident (``-1`` for noise).
+
+    The minimum spanning tree of the mutual reachability distances is
+    computed on the nearest-neighbour graph of the distinct points (at
+    least ``n_neighbors`` and ``min_samples`` neighbours) rather than on all
+    pairs. Parts of the data that this graph does not connect are joined by
+    their shortest mutual reachability edges (Borůvka), so there is always
+    a single tree. ``min_samples`` defaults to ``min_cluster_size``.
+    """
+    min_samples = min_cluster_size if min_samples is None else min_samples
+    X, boxsize, valid = features(accidents, time_scale)
+    points, weight, inverse = _distinct(X, valid)
+    n = len(points)
+    if n < 2:
+        return np.full(len(accidents), -1, dtype="int64")
+    tree = cKDTree(points, boxsize=boxsize if boxsize.any() else None)
+    core = _core_distance(tree, points, weight, min_samples)
+
+    # the neighbour graph must reach the core distance of every point, or real MST edges are missing
+    k = min(max(n_neighbors, min_samples) + 1, n)
+    dist, idx = tree.query(points, k=k)
+    rows = np.repeat(np.arange(n), k - 1)
+    cols = idx[:, 1:].ravel()
+    reach = np.maximum(np.maximum(dist[:, 1:].ravel(), core[rows]), core[cols])
+    mst = _spanning_tree(tree, points, core, boxsize if boxsize.any() else None, rows, cols, reach)
+    order = np.argsort(mst.data, kind="stable")
+    point_labels = _condense(n, weight, mst.row[order], mst.col[order], mst.data[order], min_cluster_size)
+    return _relabel(_expand(point_labels, inverse, valid))
+
+
+def cluster_summary(labels, accidents):
+    """One row per cluster: LV95 and WGS84 centroid, extent and accident counts.
+
+    The counts are those of :func:`~roadaccidents.aggregate.group_counts`
+    (per severity, type, year and flag).
+    """
+    labels = np.asarray(labels, dtype="int64")
+    n = int(labels.max()) + 1 if len(labels) else 0
+    summary = group_counts(labels, accidents, n, name="cluster")
+    x, y = coords.lv95_xy(accidents)
+    member = labels >= 0
+    size = np.maximum(summary["accidents"].to_numpy(), 1)
+    cx = np.bincount(labels[member], weights=x[member], minlength=n) / size
+    cy = np.bincount(labels[member], weights=y[member], minlength=n) / size
+    spread = np.hypot(x[member] - cx[labels[member]], y[member] - cy[labels[member]])
+    radius = np.zeros(n)
+    np.maximum.at(radius, labels[member], spread)
+    lon, lat = coords.transform(cx, cy, coords.LV95, coords.WGS84)
+    centroids = pd.DataFrame(
+        {coords.LV95_E: cx, coords.LV95_N: cy, coords.WGS84_E: lon, coords.WGS84_N: lat, "radius": radius},
+        index=summary.index,
+    )
+    return centroids.join(summary)
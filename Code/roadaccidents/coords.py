@@ -0,0 +1,72 @@
+"""Batched coordinate transforms for the accident table.
+
+ASTRA only publishes LV95 (EPSG:2056) coordinates. Instead of building a
+point geometry per accident and calling ``to_crs`` (once for WGS84 and once
+more for the UTM zone of the OSM graph), the raw E/N arrays are transformed
+in a single vectorized call with a cached ``pyproj.Transformer``. Geometry
+objects are only built by :func:`to_geodataframe` when a map needs them.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+from pyproj import CRS, Transformer
+
+LV95 = "EPSG:2056"
+WGS84 = "EPSG:4326"
+
+LV95_E = "AccidentLocation_CHLV95_E"
+LV95_N = "AccidentLocation_CHLV95_N"
+WGS84_E = "AccidentLocation_WGS84_E"
+WGS84_N = "AccidentLocation_WGS84_N"
+
+
+@lru_cache(maxsize=None)
+def _transformer(src, dst):
+    return Transformer.from_crs(src, dst, always_xy=True)
+
+
+def get_transformer(src, dst):
+    """Return the shared ``Transformer`` for the CRS pair ``src`` -> ``dst``."""
+    return _transformer(CRS.from_user_input(src).to_string(), CRS.from_user_input(dst).to_string())
+
+
+def transform(x, y, src, dst):
+    """Transform coordinate arrays from ``src`` to ``dst`` in one call."""
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    if CRS.from_user_input(src) == CRS.from_user_input(dst):
+        return x.copy(), y.copy()
+    return get_transformer(src, dst).transform(x, y)
+
+
+def lv95_xy(df):
+    """Return the LV95 coordinates of ``df`` as two float arrays."""
+    return df[LV95_E].to_numpy("float64"), df[LV95_N].to_numpy("float64")
+
+
+def projected_xy(df, crs):
+    """Return the accident coordinates of ``df`` in ``crs``.
+
+    The transform always starts from the original LV95 values, so projecting
+    to the CRS of an OSM graph costs one transform instead of two.
+    """
+    if CRS.from_user_input(crs) == CRS.from_user_input(WGS84) and WGS84_E in df:
+        return df[WGS84_E].to_numpy("float64"), df[WGS84_N].to_numpy("float64")
+    return transform(*lv95_xy(df), LV95, crs)
+
+
+def add_wgs84(df):
+    """Add the WGS84 longitude/latitude columns to ``df`` in place."""
+    lon, lat = transform(*lv95_xy(df), LV95, WGS84)
+    df[WGS84_E] = lon
+    df[WGS84_N] = lat
+    return df
+
+
+def to_geodataframe(df, crs=WGS84):
+    """Build a point ``GeoDataFrame`` of the accidents in ``crs``."""
+    import geopandas as gpd
+
+    x, y = projected_xy(df, crs)
+    return gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(x, y), crs=crs)
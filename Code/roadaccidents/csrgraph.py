@@ -0,0 +1,204 @@
+"""Array-backed road graph for the analytics code.
+
+A national ``MultiDiGraph`` stores every node and edge as a Python dict,
+which needs gigabytes and cannot be shared between processes without
+pickling it. :class:`CSRGraph` keeps the same information in flat NumPy
+arrays (compressed sparse rows of the out-edges, edge attributes and one
+coordinate buffer for all edge geometries). Saved graphs are opened with
+``mmap_mode="r"``, so worker processes share the pages of one copy.
+
+Nodes are addressed by their row (``int32``); ``osmid`` maps rows back to
+the OSM ids used by osmnx. Edges are sorted by start node, so the edges
+leaving node ``i`` are ``indptr[i]:indptr[i + 1]``.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from . import coords
+
+ARRAYS = ["osmid", "x", "y", "indptr", "u", "v", "key", "length", "highway", "geom_offsets", "geom_xy"]
+
+
+class CSRGraph:
+    """Directed multigraph in compressed sparse row form."""
+
+    def __init__(self, osmid, x, y, indptr, u, v, key, length, highway, geom_offsets, geom_xy,
+                 highway_labels=(), crs=coords.LV95, path=None):
+        self.osmid = osmid
+        self.x = x
+        self.y = y
+        self.indptr = indptr
+        self.u = u
+        self.v = v
+        self.key = key
+        self.length = length
+        self.highway = highway
+        self.geom_offsets = geom_offsets
+        self.geom_xy = geom_xy
+        self.highway_labels = list(highway_labels)
+        self.crs = crs
+        self.path = path
+
+    def __repr__(self):
+        return f"CSRGraph({self.n_nodes} nodes, {self.n_edges} edges, crs={self.crs!r})"
+
+    @property
+    def n_nodes(self):
+        return len(self.osmid)
+
+    @property
+    def n_edges(self):
+        return len(self.v)
+
+    # mapped graphs are re-opened by path instead of being copied into workers
+    def __reduce__(self):
+        if self.path is not None:
+            return (CSRGraph.load, (self.path,))
+        return (_from_state, (self._arrays(), self.highway_labels, self.crs))
+
+    def _arrays(self):
+        return {name: getattr(self, name) for name in ARRAYS}
+
+    @classmethod
+    def _build(cls, osmid, x, y, u, v, key, length, highway, geometry, crs):
+        """Build the graph from unsorted per-edge arrays (node rows in ``u``/``v``)."""
+        order = np.lexsort((key, v, u))
+        u, v, key, length, highway = u[order], v[order], key[order], length[order], highway[order]
+        geometry = geometry[order]
+
+        labels, codes = np.unique(np.asarray(highway, dtype=str), return_inverse=True)
+        indptr = np.zeros(len(osmid) + 1, dtype="int64")
+        np.cumsum(np.bincount(u, minlength=len(osmid)), out=indptr[1:])
+        geom_xy, part = shapely.get_coordinates(geometry, return_index=True)
+        geom_offsets = np.zeros(len(geometry) + 1, dtype="int64")
+        np.cumsum(np.bincount(part, minlength=len(geometry)), out=geom_offsets[1:])
+        return cls(
+            osmid=np.asarray(osmid, dtype="int64"),
+            x=np.asarray(x, dtype="float64"),
+            y=np.asarray(y, dtype="float64"),
+            indptr=indptr,
+            u=u.astype("int32"),
+            v=v.astype("int32"),
+            key=key.astype("int32"),
+            length=length.astype("float64"),
+            highway=codes.astype("int16"),
+            geom_offsets=geom_offsets,
+            geom_xy=geom_xy,
+            highway_labels=labels.tolist(),
+            crs=crs,
+        )
+
+    @classmethod
+    def from_networkx(cls, G):
+        """Convert an osmnx ``MultiDiGraph`` (projected or not)."""
+        osmid = np.fromiter(G.nodes, dtype="int64", count=G.number_of_nodes())
+        row = pd.Series(np.arange(len(osmid)), index=osmid)
+        x = np.array([d["x"] for _, d in G.nodes(data=True)], dtype="float64")
+        y = np.array([d["y"] for _, d in G.nodes(data=True)], dtype="float64")
+
+        u, v, key, length, highway, geometry = [], [], [], [], [], []
+        for a, b, k, d in G.edges(keys=True, data=True):
+            u.append(a)
+            v.append(b)
+            key.append(k)
+            length.append(d.get("length", np.nan))
+            hw = d.get("highway", "")
+            highway.append(hw[0] if isinstance(hw, list) else hw)
+            geometry.append(d.get("geometry"))
+        u = row.loc[u].to_numpy()
+        v = row.loc[v].to_numpy()
+        geometry = np.array(geometry, dtype=object)
+        missing = np.flatnonzero(pd.isna(geometry))
+        if len(missing):
+            ends = np.column_stack([x[u[missing]], y[u[missing]], x[v[missing]], y[v[missing]]])
+            geometry[missing] = shapely.linestrings(ends.reshape(-1, 2, 2))
+        return cls._build(osmid, x, y, u, v, np.asarray(key, dtype="int64"), np.asarray(length, dtype="float64"),
+                          np.asarray(highway, dtype=object), geometry, G.graph.get("crs", coords.WGS84))
+
+    @classmethod
+    def from_store(cls, store, bbox=None, polygon=None):
+        """Build the graph from an :mod:`~roadaccidents.osmstore` directory."""
+        from . import osmstore
+
+        nodes, edges = osmstore.load_frames(store, bbox=bbox, polygon=polygon)
+        row = pd.Series(np.arange(len(nodes)), index=nodes["osmid"].to_numpy())
+        return cls._build(
+            nodes["osmid"].to_numpy(), nodes["x"].to_numpy(), nodes["y"].to_numpy(),
+            row.loc[edges["u"]].to_numpy(), row.loc[edges["v"]].to_numpy(),
+            edges["key"].to_numpy("int64"), edges["length"].to_numpy("float64"),
+            edges["highway"].to_numpy(object), np.asarray(edges["geometry"].array, dtype=object),
+            osmstore.read_meta(store)["crs"],
+        )
+
+    def to_networkx(self):
+        """Convert back to an osmnx-compatible ``MultiDiGraph``."""
+        import networkx as nx
+
+        G = nx.MultiDiGraph(crs=self.crs)
+        G.add_nodes_from(
+            (int(i), {"x": float(a), "y": float(b)}) for i, a, b in zip(self.osmid, self.x, self.y)
+        )
+        labels = np.asarray(self.highway_labels, dtype=object)
+        G.add_edges_from(
+            (int(self.osmid[a]), int(self.osmid[b]), int(k), {"length": float(m), "highway": h, "geometry": g})
+            for a, b, k, m, h, g in zip(self.u, self.v, self.key, self.length, labels[self.highway], self.geometries())
+        )
+        return G
+
+    def geometries(self, edges=None):
+        """Return the edge geometries as shapely LineStrings."""
+        edges = np.arange(self.n_edges) if edges is None else np.asarray(edges)
+        starts = self.geom_offsets[edges]
+        counts = self.geom_offsets[edges + 1] - starts
+        take = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        return shapely.linestrings(self.geom_xy[take], indices=np.repeat(np.arange(len(edges)), counts))
+
+    def edge_frame(self):
+        """Return ``u``, ``v``, ``key`` (as OSM ids), ``length`` and ``highway`` per edge."""
+        return pd.DataFrame({
+            "u": self.osmid[self.u],
+            "v": self.osmid[self.v],
+            "key": self.key,
+            "length": self.length,
+            "highway": pd.Categorical.from_codes(self.highway, self.highway_labels),
+        })
+
+    def edge_lookup(self, u, v, key):
+        """Return the edge row of each ``(u, v, key)`` given as OSM ids, ``-1`` if unknown."""
+        edges = pd.MultiIndex.from_arrays([self.osmid[self.u], self.osmid[self.v], self.key])
+        return edges.get_indexer(pd.MultiIndex.from_arrays([np.asarray(u), np.asarray(v), np.asarray(key)]))
+
+    def to_edge_index(self):
+        """Return an :class:`~roadaccidents.snapping.EdgeIndex` over the edges."""
+        from .snapping import EdgeIndex
+
+        edges = self.edge_frame()[["u", "v", "key"]]
+        edges["geometry"] = self.geometries()
+        return EdgeIndex(edges, crs=self.crs)
+
+    def save(self, path):
+        """Write every array as ``.npy`` so that :meth:`load` can map it."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, arr in self._arrays().items():
+            np.save(path / f"{name}.npy", np.ascontiguousarray(arr))
+        meta = {"crs": str(self.crs), "highway_labels": self.highway_labels}
+        (path / "csrgraph.json").write_text(json.dumps(meta, indent=2))
+        self.path = str(path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        path = Path(path)
+        meta = json.loads((path / "csrgraph.json").read_text())
+        mode = "r" if mmap else None
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode=mode) for name in ARRAYS}
+        return cls(**arrays, highway_labels=meta["highway_labels"], crs=meta["crs"], path=str(path) if mmap else None)
+
+
+def _from_state(arrays, highway_labels, crs):
+    return CSRGraph(**arrays, highway_labels=highway_labels, crs=crs)
@@ -0,0 +1,201 @@
+"""Pre-aggregated accident counts for instant slice-and-dice.
+
+The analysis notebooks answer questions like "accident types of the fatal
+accidents" by filtering the full table every time. :class:`Cube` counts
+the accidents once over year x month x weekday x hour x canton x road type
+x accident type x severity x involvement flags. The dense cube would have
+over a billion cells, but only a few hundred thousand of them are non-zero,
+so it is stored sparsely: one row per non-empty cell with the code of
+every dimension and the count. A query filters those rows with lookup
+tables and rolls the rest up with one ``np.bincount``, which takes
+milliseconds.
+
+::
+
+    cube = load_cube("RoadTrafficAccidentLocations.csv")
+    cube.query("AccidentType", AccidentSeverityCategory="as1")
+    cube.query(["AccidentYear", "CantonCode"], RoadType=["rt430", "rt431"])
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .loader import CATEGORIES, FLAGS, cache_path, load_accidents
+
+DIMENSIONS = (
+    "AccidentYear",
+    "AccidentMonth",
+    "AccidentWeekDay",
+    "AccidentHour",
+    "CantonCode",
+    "RoadType",
+    "AccidentType",
+    "AccidentSeverityCategory",
+    *FLAGS,
+)
+
+
+def _encode(values):
+    """Return integer codes and labels for one dimension; missing values get a label of their own."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy("int64")
+        labels = list(values.cat.categories)
+    elif values.dtype == bool:
+        return values.to_numpy().astype("int64"), [False, True]
+    else:
+        codes, uniques = pd.factorize(values, sort=True, use_na_sentinel=True)
+        labels = [int(v) for v in uniques]
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(labels), codes)
+        labels.append(None)
+    return codes, labels
+
+
+class Cube:
+    """Sparse count cube; ``codes[dim][i]`` is the label index of non-empty cell ``i``."""
+
+    def __init__(self, codes, labels, counts):
+        self.codes = codes
+        self.labels = labels
+        self.counts = counts
+
+    def __repr__(self):
+        shape = " x ".join(str(len(self.labels[dim])) for dim in self.dimensions)
+        return f"Cube({self.total} accidents in {len(self.counts)} cells of {shape})"
+
+    @property
+    def dimensions(self):
+        return list(self.labels)
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    @classmethod
+    def build(cls, accidents, dimensions=DIMENSIONS):
+        """Count ``accidents`` over ``dimensions``."""
+        encoded = {dim: _encode(accidents[dim]) for dim in dimensions}
+        shape = tuple(len(labels) for _, labels in encoded.values())
+        flat = np.ravel_multi_index([codes for codes, _ in encoded.values()], shape)
+        cells, counts = np.unique(flat, return_counts=True)
+        cell_codes = np.unravel_index(cells, shape)
+        codes = {
+            dim: cell_codes[i].astype("int16") for i, dim in enumerate(dimensions)
+        }
+        labels = {dim: labels for dim, (_, labels) in encoded.items()}
+        return cls(codes, labels, counts.astype("int64"))
+
+    def _mask(self, filters):
+        mask = np.ones(len(self.counts), dtype=bool)
+        for dim, wanted in filters.items():
+            if dim not in self.labels:
+                raise KeyError(f"{dim!r} is not a dimension of the cube")
+            labels = self.labels[dim]
+            wanted = wanted if isinstance(wanted, (list, tuple, set, np.ndarray, range)) else [wanted]
+            allowed = np.zeros(len(labels), dtype=bool)
+            for value in wanted:
+                if value not in labels:
+                    raise ValueError(f"unknown value {value!r} for {dim}")
+                allowed[labels.index(value)] = True
+            mask &= allowed[self.codes[dim]]
+        return mask
+
+    def query(self, by=None, complete=True, **filters):
+        """Count the accidents matching ``filters``, optionally grouped by ``by``.
+
+        Every filter is a dimension name with one value or a list of values,
+        e.g. ``AccidentYear=range(2018, 2021)``. Without ``by`` the total is
+        returned, otherwise a Series indexed by the labels of the ``by``
+        dimensions; with ``complete`` it contains every combination, zero
+        counts included.
+        """
+        mask = self._mask(filters)
+        if by is None:
+            return int(self.counts[mask].sum())
+        by = [by] if isinstance(by, str) else list(by)
+        shape = tuple(len(self.labels[dim]) for dim in by)
+        flat = np.ravel_multi_index([self.codes[dim][mask] for dim in by], shape)
+        counts = np.bincount(flat, weights=self.counts[mask], minlength=int(np.prod(shape))).astype("int64")
+        if len(by) == 1:
+            labels = self.labels[by[0]]
+            index = pd.Index(labels, name=by[0], dtype=object if None in labels else None)
+        else:
+            index = pd.MultiIndex.from_product([self.labels[dim] for dim in by], names=by)
+        result = pd.Series(counts, index=index, name="accidents")
+        return result if complete else result[result > 0]
+
+    def rollup(self, dimensions):
+        """Return a smaller cube over ``dimensions`` only."""
+        dimensions = list(dimensions)
+        shape = tuple(len(self.labels[dim]) for dim in dimensions)
+        flat = np.ravel_multi_index([self.codes[dim] for dim in dimensions], shape)
+        cells, inverse = np.unique(flat, return_inverse=True)
+        counts = np.bincount(inverse, weights=self.counts, minlength=len(cells)).astype("int64")
+        cell_codes = np.unravel_index(cells, shape)
+        codes = {dim: cell_codes[i].astype("int16") for i, dim in enumerate(dimensions)}
+        return Cube(codes, {dim: self.labels[dim] for dim in dimensions}, counts)
+
+    def dense(self, dimensions=None):
+        """Return the cube over ``dimensions`` as a dense ``int64`` array and the axis labels."""
+        dimensions = self.dimensions if dimensions is None else list(dimensions)
+        shape = tuple(len(self.labels[dim]) for dim in dimensions)
+        array = np.zeros(shape, dtype="int64")
+        np.add.at(array, tuple(self.codes[dim] for dim in dimensions), self.counts)
+        return array, [self.labels[dim] for dim in dimensions]
+
+    def to_frame(self):
+        """One row per non-empty cell with the labels of every dimension and the count."""
+        frame = pd.DataFrame(
+            {dim: np.asarray(self.labels[dim], dtype=object)[self.codes[dim]] for dim in self.dimensions}
+        )
+        for dim in self.dimensions:
+            if dim in CATEGORIES:
+                frame[dim] = pd.Categorical(frame[dim], categories=CATEGORIES[dim])
+        frame["accidents"] = self.counts
+        return frame
+
+    def save(self, path):
+        """Write the cells to Parquet; the labels go into the schema metadata."""
+        table = pa.table({**{dim: self.codes[dim] for dim in self.dimensions}, "accidents": self.counts})
+        meta = {"labels": self.labels}
+        table = table.replace_schema_metadata({"cube": json.dumps(meta, default=_json_default)})
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        pq.write_table(table, tmp)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        table = pq.read_table(path)
+        labels = json.loads(table.schema.metadata[b"cube"])["labels"]
+        codes = {dim: table.column(dim).to_numpy() for dim in labels}
+        return cls(codes, labels, table.column("accidents").to_numpy())
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"cannot store {value!r} in the cube metadata")
+
+
+def load_cube(path="RoadTrafficAccidentLocations.csv", cache_dir=None, dimensions=DIMENSIONS):
+    """Load the cube for the CSV at ``path``, building and caching it on first use.
+
+    The cube is stored next to the typed accident cache and keyed on the
+    same file hash, so a new ASTRA release gets a new cube.
+    """
+    accidents_cache = cache_path(path, (), cache_dir)
+    target = accidents_cache.with_name(accidents_cache.stem + "-cube.parquet")
+    if target.exists():
+        cube = Cube.load(target)
+        if cube.dimensions == list(dimensions):
+            return cube
+    cube = Cube.build(load_accidents(path, cache_dir=cache_dir), dimensions)
+    cube.save(target)
+    return cube
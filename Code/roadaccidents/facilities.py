@@ -0,0 +1,222 @@
+"""Distance from accidents or buildings to the nearest facility.
+
+``Open Street Map.py`` computes the distance to the next bus stop with
+``gdf_bldg.geometry.apply(lambda b: gdf_stops.distance(b).min())``, i.e.
+every building against every stop in Python. :func:`nearest_facility`
+answers the same question for all sources in one bulk query: a KD-tree
+when both layers are points, otherwise an STRtree over the facilities
+(distances to polygons are to their boundary, and zero inside).
+
+Straight-line distances ignore rivers, railways and motorways.
+:func:`network_distance` measures along a :class:`~roadaccidents.csrgraph.CSRGraph`
+instead: sources and facilities are snapped to their nearest node and one
+multi-source Dijkstra from all facilities gives the distance to the
+nearest facility for every node, so every source costs a lookup.
+
+Layers can be GeoDataFrames (reprojected to ``crs``), the accident table
+(its LV95 columns) or plain arrays of shapely geometries. Results are
+indexed like the sources, by ``AccidentUID`` for the accident table.
+
+::
+
+    near = nearest_facilities(accidents, {"school": schools, "crossing": crossings})
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from . import coords
+from .snapping import nearest
+
+CHUNK_SIZE = 200_000
+
+MODES = ("walk", "drive")
+
+
+def geometries(layer, crs=coords.LV95):
+    """Return the geometries of ``layer`` in ``crs`` as an array."""
+    if hasattr(layer, "geometry") and hasattr(layer, "crs"):
+        if layer.crs is not None:
+            layer = layer.to_crs(crs)
+        return np.asarray(layer.geometry.array, dtype=object)
+    if isinstance(layer, pd.DataFrame):
+        return shapely.points(*coords.projected_xy(layer, crs))
+    return np.asarray(layer, dtype=object)
+
+
+def _labels(layer):
+    if isinstance(layer, pd.DataFrame) and coords.LV95_E in layer and "AccidentUID" in layer:
+        return pd.Index(layer["AccidentUID"].to_numpy(), name="AccidentUID")
+    if isinstance(layer, pd.DataFrame):
+        return layer.index
+    return pd.RangeIndex(len(layer))
+
+
+def _take_labels(layer, item):
+    """Labels of ``layer`` at ``item``, NA where ``item`` is -1; integer ids stay exact (``Int64``)."""
+    labels = _labels(layer)
+    if pd.api.types.is_integer_dtype(labels.dtype):
+        labels = pd.array(labels, dtype="Int64")
+    else:
+        labels = pd.array(labels)
+    return labels.take(item, allow_fill=True)
+
+
+def _present(geometry):
+    """Positions of the geometries that are neither missing nor empty."""
+    return np.flatnonzero(~shapely.is_missing(geometry) & ~shapely.is_empty(geometry))
+
+
+def _all_points(geometry):
+    return bool(len(geometry)) and bool((shapely.get_type_id(geometry) == 0).all())
+
+
+def _nearest_geometries(tree, geometry, max_distance):
+    source, target, distance = [], [], []
+    for start in range(0, len(geometry), CHUNK_SIZE):
+        (s, t), d = tree.query_nearest(
+            geometry[start:start + CHUNK_SIZE], max_distance=max_distance, return_distance=True, all_matches=False
+        )
+        source.append(s + start)
+        target.append(t)
+        distance.append(d)
+    return np.concatenate(source), np.concatenate(target), np.concatenate(distance)
+
+
+def nearest_facility(sources, facilities, max_distance=None, crs=coords.LV95, name="facility"):
+    """Nearest facility and its distance for every source.
+
+    Returns a DataFrame indexed like ``sources`` with the columns ``name``
+    (the index label of the facility) and ``<name>_distance`` in CRS units.
+    Sources without a facility within ``max_distance`` get NA and NaN.
+    """
+    source_geometry = geometries(sources, crs)
+    facility_geometry = geometries(facilities, crs)
+    n = len(source_geometry)
+    item = np.full(n, -1, dtype="int64")
+    distance = np.full(n, np.nan)
+
+    rows = _present(source_geometry)
+    # get_coordinates skips empty geometries, so the KD-tree positions are mapped back through kept
+    kept = _present(facility_geometry)
+    if len(kept) and len(rows):
+        if _all_points(source_geometry[rows]) and _all_points(facility_geometry[kept]):
+            tree = cKDTree(shapely.get_coordinates(facility_geometry[kept]))
+            points = rows
+            d, i = tree.query(
+                shapely.get_coordinates(source_geometry[points]),
+                distance_upper_bound=np.inf if max_distance is None else max_distance,
+                workers=-1,
+            )
+            found = np.isfinite(d)
+            item[points[found]] = kept[i[found]]
+            distance[points[found]] = d[found]
+        else:
+            tree = shapely.STRtree(facility_geometry)
+            if _all_points(source_geometry[rows]):
+                xy = shapely.get_coordinates(source_geometry[rows])
+                point, i, d = nearest(tree, xy[:, 0], xy[:, 1], max_distance=max_distance, chunk_size=CHUNK_SIZE)
+            else:
+                point, i, d = _nearest_geometries(tree, source_geometry[rows], max_distance)
+            item[rows[point]] = i
+            distance[rows[point]] = d
+
+    return pd.DataFrame(
+        {name: _take_labels(facilities, item), f"{name}_distance": distance},
+        index=_labels(sources),
+    )
+
+
+def nearest_facilities(sources, layers, max_distance=None, crs=coords.LV95):
+    """:func:`nearest_facility` for several facility layers, e.g. ``{"school": ..., "crossing": ...}``."""
+    source_geometry = geometries(sources, crs)
+    frames = [
+        nearest_facility(source_geometry, facilities, max_distance, crs, name) for name, facilities in layers.items()
+    ]
+    result = pd.concat(frames, axis=1)
+    result.index = _labels(sources)
+    return result
+
+
+def _snap_to_nodes(tree, geometry, max_snap):
+    """Nearest node row and distance per geometry (polygons by a point on their surface).
+
+    Missing and empty geometries get node ``-1``.
+    """
+    node = np.full(len(geometry), -1, dtype="int64")
+    distance = np.full(len(geometry), np.nan)
+    rows = _present(geometry)
+    if not len(rows):
+        return node, distance
+    geometry = geometry[rows]
+    points = np.where(shapely.get_type_id(geometry) == 0, geometry, shapely.point_on_surface(geometry))
+    d, i = tree.query(
+        shapely.get_coordinates(points), distance_upper_bound=np.inf if max_snap is None else max_snap, workers=-1
+    )
+    found = np.isfinite(d)
+    node[rows[found]] = i[found]
+    distance[rows[found]] = d[found]
+    return node, distance
+
+
+def network_distance(sources, facilities, graph, mode="walk", max_distance=None, max_snap=None, name="facility"):
+    """Nearest facility along the road network for every source.
+
+    ``graph`` is a :class:`~roadaccidents.csrgraph.CSRGraph` (use
+    ``CSRGraph.from_networkx`` for an osmnx graph). With ``mode="walk"``
+    edges can be used in both directions, with ``"drive"`` only in their
+    own direction, from the source to the facility. The distance includes
+    the straight-line snapping distance at both ends. Sources farther than
+    ``max_snap`` from every node or without a facility within
+    ``max_distance`` get NA and NaN. Returns the same columns as
+    :func:`nearest_facility`.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, not {mode!r}")
+    source_geometry = geometries(sources, graph.crs)
+    facility_geometry = geometries(facilities, graph.crs)
+    tree = cKDTree(np.column_stack([graph.x, graph.y]))
+    source_node, source_snap = _snap_to_nodes(tree, source_geometry, max_snap)
+    facility_node, facility_snap = _snap_to_nodes(tree, facility_geometry, max_snap)
+    snapped = np.flatnonzero(facility_node >= 0)
+
+    # parallel edges: keep the shortest; zero weights would be dropped by scipy
+    n = graph.n_nodes
+    u = np.asarray(graph.u, dtype="int64")
+    v = np.asarray(graph.v, dtype="int64")
+    order = np.lexsort((graph.length, v, u))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (u[order][1:] != u[order][:-1]) | (v[order][1:] != v[order][:-1])
+    edges = order[first]
+    # every facility gets a node of its own, linked to its nearest graph node by the snapping distance;
+    # Dijkstra runs from the facilities towards the sources, i.e. on the reversed graph
+    tail = np.concatenate([v[edges], n + np.arange(len(snapped))])
+    head = np.concatenate([u[edges], facility_node[snapped]])
+    weight = np.maximum(np.concatenate([graph.length[edges], facility_snap[snapped]]), 1e-6)
+    size = n + len(snapped)
+    matrix = sparse.csr_matrix((weight, (tail, head)), shape=(size, size))
+
+    item = np.full(len(source_geometry), -1, dtype="int64")
+    distance = np.full(len(source_geometry), np.nan)
+    if len(snapped):
+        dist, _, nearest_source = dijkstra(
+            matrix, directed=mode == "drive", indices=n + np.arange(len(snapped)), min_only=True,
+            return_predecessors=True, limit=np.inf if max_distance is None else max_distance,
+        )
+        ok = source_node >= 0
+        ok[ok] = np.isfinite(dist[source_node[ok]])
+        item[ok] = snapped[nearest_source[source_node[ok]] - n]
+        distance[ok] = dist[source_node[ok]] + source_snap[ok]
+        if max_distance is not None:
+            beyond = distance > max_distance
+            item[beyond] = -1
+            distance[beyond] = np.nan
+
+    return pd.DataFrame(
+        {name: _take_labels(facilities, item), f"{name}_distance": distance},
+        index=_labels(sources),
+    )
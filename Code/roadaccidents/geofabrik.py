@@ -0,0 +1,170 @@
+"""Region extracts from the Geofabrik shapefiles without reading all of Switzerland.
+
+``Open Street Map.py`` reads ``gis_osm_buildings_a_free_1.shp`` (about 2.5
+million buildings) completely and then keeps one city with ``.within``.
+:func:`import_geofabrik` converts the shapefiles once into GeoParquet files
+in a store directory::
+
+    meta.json                   CRS and source file hashes per layer
+    buildings_a.parquet         one file per shapefile, ``gis_osm_<layer>_free_1.shp``
+    pois.parquet
+    ...
+
+Every file carries the GeoParquet 1.1 ``bbox`` covering column. Features
+are sorted along a Z-order curve of their bounding box centre, so the
+row groups cover compact areas and their ``bbox`` statistics let
+:func:`read_region` skip everything outside the query box. Filters on
+attribute columns such as ``fclass`` or ``type`` are pushed down to the
+Parquet reader as well; only the remaining rows are decoded and tested
+against the exact polygon.
+
+::
+
+    store = "osm/store"
+    import_geofabrik("osm/switzerland-latest-free.shp", store)
+    churches = read_region(store, "buildings_a", polygon=luzern, type="church")
+"""
+
+import json
+import re
+from pathlib import Path
+
+import numpy as np
+import pyarrow.compute as pc
+import shapely
+
+from . import coords
+from .loader import file_digest
+from .osmstore import zorder
+
+ROW_GROUP_SIZE = 16_384
+
+SHAPEFILE = re.compile(r"gis_osm_(?P<layer>\w+?)_free_1\.shp$")
+
+PREDICATES = ("intersects", "within")
+
+
+def _write_meta(store, meta):
+    (Path(store) / "meta.json").write_text(json.dumps(meta, indent=2))
+
+
+def read_meta(store):
+    path = Path(store) / "meta.json"
+    return json.loads(path.read_text()) if path.exists() else {"layers": {}}
+
+
+def import_layer(shapefile, store, layer=None, crs=coords.LV95):
+    """Convert one Geofabrik shapefile into ``<store>/<layer>.parquet``.
+
+    ``layer`` defaults to the part of the file name between ``gis_osm_``
+    and ``_free_1``. Needs ``geopandas``.
+    """
+    import geopandas as gpd
+
+    shapefile = Path(shapefile)
+    if layer is None:
+        match = SHAPEFILE.search(shapefile.name)
+        layer = match["layer"] if match else shapefile.stem
+    store = Path(store)
+    store.mkdir(parents=True, exist_ok=True)
+
+    gdf = gpd.read_file(shapefile, encoding="utf-8").to_crs(crs)
+    bounds = gdf.geometry.bounds.to_numpy()
+    cx = (bounds[:, 0] + bounds[:, 2]) / 2
+    cy = (bounds[:, 1] + bounds[:, 3]) / 2
+    # empty geometries have no bounds and go to the end
+    valid = np.flatnonzero(np.isfinite(cx))
+    order = valid[np.argsort(zorder(cx[valid], cy[valid]), kind="stable")]
+    order = np.concatenate([order, np.flatnonzero(~np.isfinite(cx))])
+    gdf = gdf.iloc[order].reset_index(drop=True)
+    for column in ("fclass", "type"):
+        if column in gdf:
+            gdf[column] = gdf[column].astype("category")
+
+    target = store / f"{layer}.parquet"
+    tmp = target.with_suffix(".tmp")
+    gdf.to_parquet(tmp, index=False, write_covering_bbox=True, schema_version="1.1.0", row_group_size=ROW_GROUP_SIZE)
+    tmp.replace(target)
+
+    meta = read_meta(store)
+    meta["crs"] = str(crs)
+    meta["layers"][layer] = {"path": str(shapefile), "sha1": file_digest(shapefile), "features": len(gdf)}
+    _write_meta(store, meta)
+    return layer
+
+
+def import_geofabrik(directory, store, layers=None, crs=coords.LV95):
+    """Convert the ``gis_osm_*_free_1.shp`` files in ``directory`` (all, or only ``layers``).
+
+    Layers whose shapefile has not changed since the last import are skipped.
+    """
+    imported = []
+    meta = read_meta(store)
+    for shapefile in sorted(Path(directory).glob("gis_osm_*_free_1.shp")):
+        layer = SHAPEFILE.search(shapefile.name)["layer"]
+        if layers is not None and layer not in layers:
+            continue
+        known = meta["layers"].get(layer)
+        if (
+            known and meta.get("crs") == str(crs) and (Path(store) / f"{layer}.parquet").exists()
+            and known["sha1"] == file_digest(shapefile)
+        ):
+            continue
+        imported.append(import_layer(shapefile, store, layer, crs))
+    return imported
+
+
+def _attribute_filter(where):
+    expression = None
+    for column, wanted in where.items():
+        wanted = list(wanted) if isinstance(wanted, (list, tuple, set, np.ndarray)) else [wanted]
+        term = pc.field(column).isin(wanted)
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def read_region(store, layer, bbox=None, polygon=None, crs=None, predicate="intersects", columns=None, **where):
+    """Read the features of ``layer`` inside ``bbox`` or ``polygon`` as a GeoDataFrame.
+
+    ``bbox`` is ``(xmin, ymin, xmax, ymax)``; ``bbox`` and ``polygon`` are
+    in ``crs`` (the store CRS by default). With ``predicate="within"`` only
+    features completely inside the polygon are kept, like ``.within`` in
+    the notebooks. Keyword arguments filter attribute columns, with one
+    value or a list of values, e.g. ``fclass=["school", "kindergarten"]``.
+    """
+    import geopandas as gpd
+
+    if predicate not in PREDICATES:
+        raise ValueError(f"predicate must be one of {PREDICATES}, not {predicate!r}")
+    store_crs = read_meta(store).get("crs", coords.LV95)
+    if crs is not None and str(crs) != store_crs:
+        if polygon is not None:
+            polygon = shapely.transform(
+                polygon, lambda xy: np.column_stack(coords.transform(xy[:, 0], xy[:, 1], crs, store_crs))
+            )
+        if bbox is not None:
+            box = shapely.segmentize(shapely.box(*bbox), (bbox[2] - bbox[0]) / 16)
+            bbox = shapely.transform(
+                box, lambda xy: np.column_stack(coords.transform(xy[:, 0], xy[:, 1], crs, store_crs))
+            ).bounds
+    if polygon is not None and bbox is None:
+        bbox = polygon.bounds
+
+    if columns is not None:
+        columns = list(dict.fromkeys([*columns, "geometry"]))
+    gdf = gpd.read_parquet(
+        Path(store) / f"{layer}.parquet",
+        columns=columns,
+        bbox=bbox,
+        filters=_attribute_filter(where) if where else None,
+    )
+    if bbox is not None and polygon is None:
+        polygon = shapely.box(*bbox)
+    if polygon is not None:
+        shapely.prepare(polygon)
+        geometry = np.asarray(gdf.geometry.array, dtype=object)
+        keep = shapely.contains(polygon, geometry) if predicate == "within" else shapely.intersects(polygon, geometry)
+        gdf = gdf[keep]
+    if "bbox" in gdf:
+        gdf = gdf.drop(columns="bbox")
+    return gdf.reset_index(drop=True)
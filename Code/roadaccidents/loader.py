@@ -0,0 +1,146 @@
+"""Typed loader for ``RoadTrafficAccidentLocations.csv`` with a Parquet cache.
+
+The ASTRA CSV carries every catalogue value four times (``_de``, ``_fr``,
+``_it``, ``_en``). Parsing all of that as Python strings dominates the cold
+start of every analysis, so the loader only reads the columns that are
+asked for, converts them to compact dtypes and writes the result to a
+Parquet file named after the hash of the source file. Later runs read the
+Parquet file directly.
+"""
+
+import hashlib
+from pathlib import Path
+
+import pandas as pd
+
+from . import coords
+
+# bump whenever the schema or the derived columns of the cache change
+SCHEMA_VERSION = 2
+
+LANGUAGES = ("de", "fr", "it", "en")
+
+# catalogue codes, see Strassenverkehrsunfallort_Modellbeschreibung.pdf
+ACCIDENT_TYPES = ["at0", "at1", "at2", "at3", "at4", "at5", "at6", "at7", "at8", "at9", "at00"]
+SEVERITY_CATEGORIES = ["as1", "as2", "as3", "as4"]
+ROAD_TYPES = ["rt430", "rt431", "rt432", "rt433", "rt434", "rt439"]
+WEEKDAYS = ["aw401", "aw402", "aw403", "aw404", "aw405", "aw406", "aw407"]
+CANTONS = [
+    "ZH", "BE", "LU", "UR", "SZ", "OW", "NW", "GL", "ZG", "FR", "SO", "BS", "BL",
+    "SH", "AR", "AI", "SG", "GR", "AG", "TG", "TI", "VD", "VS", "NE", "GE", "JU",
+]
+
+CATEGORIES = {
+    "AccidentType": ACCIDENT_TYPES,
+    "AccidentSeverityCategory": SEVERITY_CATEGORIES,
+    "RoadType": ROAD_TYPES,
+    "CantonCode": CANTONS,
+    "AccidentWeekDay": WEEKDAYS,
+}
+
+FLAGS = [
+    "AccidentInvolvingPedestrian",
+    "AccidentInvolvingBicycle",
+    "AccidentInvolvingMotorcycle",
+]
+
+DTYPES = {
+    "AccidentUID": "string",
+    "AccidentLocation_CHLV95_E": "float64",
+    "AccidentLocation_CHLV95_N": "float64",
+    "MunicipalityCode": "Int32",
+    "AccidentYear": "int16",
+    "AccidentMonth": "int8",
+    # the hour is optional in the data model
+    "AccidentHour": "Int8",
+}
+
+# columns with a label per language, e.g. ``RoadType_de``
+LABELLED = ["AccidentType", "AccidentSeverityCategory", "RoadType", "AccidentMonth", "AccidentWeekDay"]
+
+
+def _label_columns(languages):
+    cols = [f"{col}_{lang}" for col in LABELLED for lang in languages]
+    if languages:
+        cols.append("AccidentHour_text")
+    return cols
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-1 hex digest of ``path``."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(path, languages=(), cache_dir=None):
+    """Return the Parquet cache file for the CSV at ``path``."""
+    path = Path(path)
+    cache_dir = Path(cache_dir) if cache_dir is not None else path.parent / "cache"
+    tag = "-".join(languages) or "codes"
+    return cache_dir / f"{path.stem}-{file_digest(path)[:16]}-v{SCHEMA_VERSION}-{tag}.parquet"
+
+
+def _to_categorical(series, categories):
+    values = pd.Categorical(series, categories=categories)
+    unknown = series.notna() & pd.isna(values)
+    if unknown.any():
+        raise ValueError(
+            f"unknown {series.name} codes: {sorted(series[unknown].unique())}"
+        )
+    return values
+
+
+def read_csv(path, languages=()):
+    """Parse the ASTRA CSV into a typed DataFrame without using a cache.
+
+    ``languages`` selects which label columns (``"de"``, ``"fr"``, ...) are
+    kept; by default only the codes are read.
+    """
+    unknown = set(languages) - set(LANGUAGES)
+    if unknown:
+        raise ValueError(f"unknown languages: {sorted(unknown)}")
+
+    usecols = list(DTYPES) + list(CATEGORIES) + FLAGS + _label_columns(languages)
+    dtype = dict(DTYPES)
+    dtype.update({col: "string" for col in CATEGORIES})
+    dtype.update({col: "bool" for col in FLAGS})
+    dtype.update({col: "string" for col in _label_columns(languages)})
+
+    df = pd.read_csv(
+        path,
+        usecols=usecols,
+        dtype=dtype,
+        true_values=["true", "True", "TRUE"],
+        false_values=["false", "False", "FALSE"],
+    )
+    for col, categories in CATEGORIES.items():
+        df[col] = _to_categorical(df[col], categories)
+    for col in _label_columns(languages):
+        df[col] = df[col].astype("category")
+    return df
+
+
+def load_accidents(path="RoadTrafficAccidentLocations.csv", languages=(), cache_dir=None, use_cache=True):
+    """Load the accident table, reading the Parquet cache when it is current.
+
+    The WGS84 coordinates are computed once and stored next to the LV95
+    columns. The cache is keyed on the hash of the CSV, so a new ASTRA
+    release automatically produces a new cache file.
+    """
+    languages = tuple(languages)
+    if not use_cache:
+        return coords.add_wgs84(read_csv(path, languages))
+
+    target = cache_path(path, languages, cache_dir)
+    if target.exists():
+        return pd.read_parquet(target)
+
+    df = coords.add_wgs84(read_csv(path, languages))
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(".tmp")
+    df.to_parquet(tmp, index=False)
+    tmp.replace(target)
+    return df
@@ -0,0 +1,356 @@
+"""Network-constrained kernel density (NKDE) along the road graph.
+
+A planar KDE spreads an accident over parallel roads and across rivers.
+Here the kernel is spread along the network only: both directions of a
+road are merged into one undirected edge, every edge is cut into lixels
+(linear pixels) of at most ``lixel_length`` metres, and the density of a
+lixel is the sum of ``K(d)`` over all accidents, where ``d`` is the
+shortest-path distance from the snapped accident position to the centre of
+the lixel (the "simple" NKDE of Okabe et al.).
+
+Shortest paths are computed with a Dijkstra search bounded by the
+bandwidth. The accidents are processed per LV95 tile in worker processes;
+a tile only needs the edges within ``bandwidth`` of its accidents, since a
+path of length ``d`` never leaves the disc of radius ``d`` around its
+start. The tiles only hold small renumbered arrays, so the national graph
+(which may be memory-mapped) is never copied into the workers.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+from scipy.sparse.csgraph import dijkstra
+
+from .kde import SEVERITY_WEIGHTS, severity_weights
+
+LIXEL_LENGTH = 10.0
+BANDWIDTH = 300.0
+
+# one-dimensional kernels on [-1, 1], each integrating to one
+KERNELS = {
+    "quartic": lambda u: 15 / 16 * (1 - u**2) ** 2,
+    "epanechnikov": lambda u: 3 / 4 * (1 - u**2),
+    "triangular": lambda u: 1 - np.abs(u),
+    "uniform": lambda u: np.full_like(u, 0.5),
+}
+
+
+def _ranges(starts, counts):
+    """Concatenate ``arange(s, s + c)`` for every start and count."""
+    counts = np.asarray(counts, dtype="int64")
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(np.asarray(starts, dtype="int64") - offsets, counts) + np.arange(counts.sum())
+
+
+def _first_per_key(key, value):
+    """Return the positions of the smallest ``value`` per distinct ``key``."""
+    order = np.lexsort((value, key))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = key[order][1:] != key[order][:-1]
+    return order[first]
+
+
+class LixelNetwork:
+    """Undirected edges of a :class:`~roadaccidents.csrgraph.CSRGraph` cut into lixels.
+
+    Undirected edge ``e`` joins the node rows ``a[e] < b[e]`` and is
+    represented by the directed edge row ``first[e]``; parallel edges are
+    collapsed as in :func:`~roadaccidents.segments.build_segments`. Its
+    lixels are ``lixel_start[e]:lixel_start[e + 1]``, numbered from ``a``
+    towards ``b``.
+    """
+
+    def __init__(self, graph, lixel_length=LIXEL_LENGTH):
+        n = graph.n_nodes
+        a = np.minimum(graph.u, graph.v).astype("int64")
+        b = np.maximum(graph.u, graph.v).astype("int64")
+        _, first, undirected = np.unique(a * n + b, return_index=True, return_inverse=True)
+        self.graph = graph
+        self.lixel_length = lixel_length
+        self.a = a[first]
+        self.b = b[first]
+        self.first = first
+        self.undirected = undirected
+        self.length = np.asarray(graph.length[first], dtype="float64")
+        self.n_lixels = np.maximum(np.ceil(self.length / lixel_length), 1).astype("int64")
+        self.lixel_start = np.zeros(len(first) + 1, dtype="int64")
+        np.cumsum(self.n_lixels, out=self.lixel_start[1:])
+
+        # undirected adjacency: node -> (edge, side), side 0 if the node is ``a``
+        ends = np.concatenate([self.a, self.b])
+        order = np.argsort(ends, kind="stable")
+        self.adj_edge = np.concatenate([np.arange(len(first))] * 2)[order]
+        self.adj_side = np.repeat(np.array([0, 1], dtype="int8"), len(first))[order]
+        self.adj_ptr = np.zeros(n + 1, dtype="int64")
+        np.cumsum(np.bincount(ends, minlength=n), out=self.adj_ptr[1:])
+
+    def __repr__(self):
+        return f"LixelNetwork({self.n_edges} edges, {self.n_lixels_total} lixels of <= {self.lixel_length} m)"
+
+    @property
+    def n_edges(self):
+        return len(self.first)
+
+    @property
+    def n_lixels_total(self):
+        return int(self.lixel_start[-1])
+
+    def lixels(self):
+        """Return one row per lixel: ``edge``, ``u``, ``v``, ``key`` (OSM ids) and ``start``/``end`` in metres."""
+        edge = np.repeat(np.arange(self.n_edges), self.n_lixels)
+        j = np.arange(self.n_lixels_total) - self.lixel_start[edge]
+        step = self.length[edge] / self.n_lixels[edge]
+        rows = self.first[edge]
+        graph = self.graph
+        frame = pd.DataFrame({
+            "edge": edge,
+            "u": graph.osmid[graph.u[rows]],
+            "v": graph.osmid[graph.v[rows]],
+            "key": graph.key[rows],
+            "start": j * step,
+            "end": (j + 1) * step,
+        })
+        frame.index.name = "lixel"
+        return frame
+
+    def locate(self, snapped, accidents):
+        """Return the undirected edge and the position along it (from ``a``) per accident.
+
+        ``snapped`` is the result of :func:`~roadaccidents.snapping.snap`;
+        accidents that were not snapped or whose edge is not part of the
+        graph get edge ``-1``.
+        """
+        snapped = snapped.reindex(accidents["AccidentUID"].to_numpy())
+        ok = snapped["u"].notna().to_numpy()
+        row = np.full(len(snapped), -1, dtype="int64")
+        row[ok] = self.graph.edge_lookup(
+            snapped["u"].to_numpy()[ok].astype("int64"),
+            snapped["v"].to_numpy()[ok].astype("int64"),
+            snapped["key"].to_numpy()[ok].astype("int64"),
+        )
+        found = row >= 0
+        edge = np.full(len(row), -1, dtype="int64")
+        position = np.zeros(len(row))
+        rows, inverse = np.unique(row[found], return_inverse=True)
+        # offsets are measured along the geometry, lixels along ``length``
+        scale = self.graph.length[rows] / np.maximum(shapely.length(self.graph.geometries(rows)), 1e-9)
+        e = self.undirected[row[found]]
+        t = snapped["offset"].to_numpy("float64")[found] * scale[inverse]
+        forward = self.graph.u[row[found]] == self.a[e]
+        edge[found] = e
+        position[found] = np.clip(np.where(forward, t, self.length[e] - t), 0, self.length[e])
+        return edge, position
+
+    def geometries(self, lixels=None):
+        """Return the lixels as LineStrings, oriented from ``a`` towards ``b``."""
+        graph = self.graph
+        lixels = np.arange(self.n_lixels_total) if lixels is None else np.asarray(lixels, dtype="int64")
+        lixel_edge = np.searchsorted(self.lixel_start, lixels, side="right") - 1
+        edges, inverse = np.unique(lixel_edge, return_inverse=True)
+
+        # vertices of the edges involved, reversed where the geometry runs from b to a
+        rows = self.first[edges]
+        starts = graph.geom_offsets[rows]
+        counts = graph.geom_offsets[rows + 1] - starts
+        part = np.repeat(np.arange(len(edges)), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        reverse = graph.u[rows] != self.a[edges]
+        take = np.where(reverse[part], starts[part] + counts[part] - 1 - k, starts[part] + k)
+        xy = graph.geom_xy[take]
+        step = np.zeros(len(xy))
+        step[1:] = np.hypot(*(xy[1:] - xy[:-1]).T)
+        step[k == 0] = 0
+        cum = np.cumsum(step)
+        along = cum - np.repeat(cum[np.cumsum(counts) - counts], counts)
+        geom_length = np.bincount(part, weights=step, minlength=len(edges))
+
+        # strictly increasing key over all edges, to find the inner vertices of a lixel
+        base = np.cumsum(geom_length + 1) - (geom_length + 1)
+        vertex_key = base[part] + along
+        scale = geom_length / np.maximum(self.length[edges], 1e-9)
+        j = lixels - self.lixel_start[lixel_edge]
+        lixel_step = self.length[lixel_edge] / self.n_lixels[lixel_edge]
+        f0 = j * lixel_step * scale[inverse]
+        f1 = (j + 1) * lixel_step * scale[inverse]
+        lo = np.searchsorted(vertex_key, base[inverse] + f0, side="right")
+        hi = np.searchsorted(vertex_key, base[inverse] + f1, side="left")
+
+        lines = shapely.linestrings(xy[:, 0], xy[:, 1], indices=part)
+        first_point = shapely.get_coordinates(shapely.line_interpolate_point(lines[inverse], f0))
+        last_point = shapely.get_coordinates(shapely.line_interpolate_point(lines[inverse], f1))
+        inner = np.maximum(hi - lo, 0)
+        n_points = inner + 2
+        out = np.empty((n_points.sum(), 2))
+        head = np.cumsum(n_points) - n_points
+        out[head] = first_point
+        out[head + n_points - 1] = last_point
+        out[_ranges(head + 1, inner)] = xy[_ranges(lo, inner)]
+        return shapely.linestrings(out, indices=np.repeat(np.arange(len(lixels)), n_points))
+
+
+def _tile_density(task):
+    a, b, length, n_lixels, edge, position, weight, bandwidth, kernel, chunk = task
+    n_nodes = int(max(a.max(), b.max())) + 1
+    matrix = sparse.csr_matrix((np.maximum(length, 1e-6), (a, b)), shape=(n_nodes, n_nodes))
+    ends = np.concatenate([a, b])
+    order = np.argsort(ends, kind="stable")
+    adj_edge = np.concatenate([np.arange(len(a))] * 2)[order]
+    adj_side = np.repeat([0, 1], len(a))[order]
+    adj_ptr = np.zeros(n_nodes + 1, dtype="int64")
+    np.cumsum(np.bincount(ends, minlength=n_nodes), out=adj_ptr[1:])
+    lixel_start = np.cumsum(n_lixels) - n_lixels
+    n_local = int(n_lixels.sum())
+    step = length / n_lixels
+    density = np.zeros(n_local)
+    kern = KERNELS[kernel]
+
+    for start in range(0, len(edge), chunk):
+        acc_edge = edge[start:start + chunk]
+        t = position[start:start + chunk]
+        w = weight[start:start + chunk]
+        k = len(acc_edge)
+
+        # bounded Dijkstra from both end nodes of the accidents' edges
+        sources, source_row = np.unique(np.concatenate([a[acc_edge], b[acc_edge]]), return_inverse=True)
+        dist = dijkstra(matrix, directed=False, indices=sources, limit=bandwidth)
+        src, node = np.nonzero(np.isfinite(dist))
+        d = dist[src, node]
+        ptr = np.zeros(len(sources) + 1, dtype="int64")
+        np.cumsum(np.bincount(src, minlength=len(sources)), out=ptr[1:])
+
+        # distance from each accident to every node reached, via either end
+        acc = np.tile(np.arange(k), 2)
+        offset = np.concatenate([t, length[acc_edge] - t])
+        counts = ptr[source_row + 1] - ptr[source_row]
+        take = _ranges(ptr[source_row], counts)
+        i = np.repeat(acc, counts)
+        reached = node[take]
+        d = d[take] + np.repeat(offset, counts)
+        near = d < bandwidth
+        i, reached, d = i[near], reached[near], d[near]
+        best = _first_per_key(i * n_nodes + reached, d)
+        i, reached, d = i[best], reached[best], d[best]
+
+        # walk from every reached node into its edges, lixel by lixel
+        counts = adj_ptr[reached + 1] - adj_ptr[reached]
+        take = _ranges(adj_ptr[reached], counts)
+        e = adj_edge[take]
+        side = adj_side[take]
+        i = np.repeat(i, counts)
+        d = np.repeat(d, counts)
+        reach = np.clip(np.floor((bandwidth - d) / step[e] + 0.5), 0, n_lixels[e]).astype("int64")
+        j = _ranges(np.zeros(len(reach)), reach)
+        e, side, i, d = (np.repeat(arr, reach) for arr in (e, side, i, d))
+        lixel = lixel_start[e] + np.where(side == 0, j, n_lixels[e] - 1 - j)
+        d = d + (j + 0.5) * step[e]
+
+        # lixels on the accident's own edge are reached directly
+        own = n_lixels[acc_edge]
+        own_i = np.repeat(np.arange(k), own)
+        own_j = _ranges(np.zeros(k), own)
+        own_d = np.abs((own_j + 0.5) * step[acc_edge][own_i] - t[own_i])
+
+        i = np.concatenate([i, own_i])
+        lixel = np.concatenate([lixel, lixel_start[acc_edge][own_i] + own_j])
+        d = np.concatenate([d, own_d])
+        best = _first_per_key(i * n_local + lixel, d)
+        i, lixel, d = i[best], lixel[best], d[best]
+        near = d < bandwidth
+        density += np.bincount(
+            lixel[near], weights=w[i[near]] * kern(d[near] / bandwidth) / bandwidth, minlength=n_local
+        )
+    return density
+
+
+def _tasks(network, edge, position, weight, tiles, bandwidth, kernel, chunk):
+    graph = network.graph
+    tree = shapely.STRtree(shapely.points(graph.x, graph.y))
+    order = np.lexsort((edge, tiles))
+    bounds = np.flatnonzero(np.r_[True, tiles[order][1:] != tiles[order][:-1], True])
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        acc = order[start:stop]
+        ends = np.concatenate([network.a[edge[acc]], network.b[edge[acc]]])
+        x, y = graph.x[ends], graph.y[ends]
+        box = shapely.box(x.min() - bandwidth, y.min() - bandwidth, x.max() + bandwidth, y.max() + bandwidth)
+        nodes = np.unique(np.concatenate([tree.query(box), ends]))
+        counts = network.adj_ptr[nodes + 1] - network.adj_ptr[nodes]
+        edges = np.unique(network.adj_edge[_ranges(network.adj_ptr[nodes], counts)])
+        local_nodes, local = np.unique(np.concatenate([network.a[edges], network.b[edges]]), return_inverse=True)
+        local_a, local_b = local[:len(edges)], local[len(edges):]
+        yield edges, (
+            local_a,
+            local_b,
+            network.length[edges],
+            network.n_lixels[edges],
+            np.searchsorted(edges, edge[acc]),
+            position[acc],
+            weight[acc],
+            bandwidth,
+            kernel,
+            chunk,
+        )
+
+
+def network_density(snapped, accidents, network, bandwidth=BANDWIDTH, kernel="quartic", weights=None,
+                    cell_size=5_000, workers=None, chunk=256):
+    """Network KDE of the snapped accidents on the lixels of ``network``.
+
+    Returns an array with one value per lixel (see :meth:`LixelNetwork.lixels`):
+    the kernel-weighted accidents per km of road. ``weights`` maps severity
+    codes to weights as in :func:`~roadaccidents.kde.hotspot_raster`
+    (``None`` counts every accident once). Accidents are processed in square
+    LV95 tiles of ``cell_size`` metres; ``workers`` defaults to the number
+    of CPUs.
+    """
+    if kernel not in KERNELS:
+        raise ValueError(f"unknown kernel {kernel!r}, expected one of {sorted(KERNELS)}")
+    edge, position = network.locate(snapped, accidents)
+    weight = np.ones(len(edge)) if weights is None else severity_weights(accidents, weights)
+    keep = (edge >= 0) & (weight > 0)
+    edge, position, weight = edge[keep], position[keep], weight[keep]
+    density = np.zeros(network.n_lixels_total)
+    if not len(edge):
+        return density
+
+    x = network.graph.x[network.a[edge]]
+    y = network.graph.y[network.a[edge]]
+    col = np.floor(x / cell_size).astype("int64")
+    row = np.floor(y / cell_size).astype("int64")
+    tiles = (col - col.min()) * (row.max() - row.min() + 1) + (row - row.min())
+    tasks = sorted(
+        _tasks(network, edge, position, weight, tiles, bandwidth, kernel, chunk), key=lambda t: -len(t[1][4])
+    )
+
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        results = [_tile_density(task) for _, task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_tile_density, [task for _, task in tasks]))
+
+    for (edges, _), local in zip(tasks, results):
+        # lixels are unique within a tile, so plain fancy-index addition is safe
+        density[_ranges(network.lixel_start[edges], network.n_lixels[edges])] += local
+    return density * 1000
+
+
+def hotspot_lixels(snapped, accidents, network, bandwidth=BANDWIDTH, kernel="quartic", weights=SEVERITY_WEIGHTS,
+                   **kwargs):
+    """Return :meth:`LixelNetwork.lixels` with a ``density`` column (per km)."""
+    lixels = network.lixels()
+    lixels["density"] = network_density(
+        snapped, accidents, network, bandwidth=bandwidth, kernel=kernel, weights=weights, **kwargs
+    )
+    return lixels
+
+
+def to_geodataframe(lixels, network, min_density=0.0):
+    """Attach the lixel geometry to the lixels with ``density > min_density``."""
+    import geopandas as gpd
+
+    rows = np.flatnonzero(lixels["density"].to_numpy() > min_density)
+    return gpd.GeoDataFrame(lixels.iloc[rows], geometry=network.geometries(rows), crs=network.graph.crs)
@@ -0,0 +1,210 @@
+"""Offline store for the OSM drive network.
+
+``ox.graph_from_place`` queries Overpass and Nominatim and rebuilds the graph
+on every run, which does not work on machines without network access.
+:func:`import_pbf` builds the directed drive network once from a local
+``.osm.pbf`` extract (e.g. ``switzerland-latest.osm.pbf`` from Geofabrik)
+and writes it to a store directory::
+
+    meta.json       CRS, source file and counts
+    nodes.parquet   osmid, x, y (in the store CRS), lon, lat
+    edges.parquet   u, v, key, osmid, highway, oneway, length, ux, uy, geometry (WKB)
+    indptr.npy      CSR offsets of the out-edges per node row
+    indices.npy     target node row per edge row
+
+Nodes are sorted along a Z-order curve and edges by the row of their start
+node, so the Parquet row-group statistics on ``x``/``y`` and ``ux``/``uy``
+let :func:`load_frames` skip everything outside a bounding box. The CSR
+arrays can be opened with ``np.load(..., mmap_mode="r")``.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from . import coords
+from .loader import file_digest
+
+ROW_GROUP_SIZE = 65_536
+
+# cell size of the Z-order curve used to sort the nodes, in metres
+SORT_CELL = 500
+
+ONEWAY_VALUES = {"yes", "true", "1", "-1", "reverse"}
+
+
+def _spread_bits(v):
+    v = v.astype("uint64") & 0xFFFFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
+
+
+def zorder(x, y, cell=SORT_CELL):
+    """Return the Z-order (Morton) key of the grid cell of each point."""
+    ix = np.floor((x - x.min()) / cell).astype("int64")
+    iy = np.floor((y - y.min()) / cell).astype("int64")
+    return _spread_bits(ix) | (_spread_bits(iy) << 1)
+
+
+def _directed(edges):
+    """Turn OSM ways split at nodes into directed edges like osmnx does."""
+    oneway = edges["oneway"].astype("string").str.lower()
+    if "junction" in edges:
+        roundabout = edges["junction"].astype("string").eq("roundabout").fillna(False)
+    else:
+        roundabout = pd.Series(False, index=edges.index)
+    is_oneway = oneway.isin(ONEWAY_VALUES).fillna(False) | roundabout
+    reverse = oneway.isin({"-1", "reverse"}).fillna(False)
+
+    forward = edges[~reverse].assign(oneway=is_oneway[~reverse])
+    backward = edges[~is_oneway | reverse].assign(oneway=is_oneway[~is_oneway | reverse])
+    backward[["u", "v"]] = backward[["v", "u"]].to_numpy()
+    backward["geometry"] = shapely.reverse(np.asarray(backward["geometry"].array, dtype=object))
+    directed = pd.concat([forward, backward], ignore_index=True)
+    directed["key"] = directed.groupby(["u", "v"]).cumcount()
+    return directed
+
+
+def write_store(nodes, edges, store, crs=coords.LV95, source=None):
+    """Write a directed network to ``store``.
+
+    ``nodes`` needs the columns ``osmid``, ``lon`` and ``lat``; ``edges`` the
+    columns ``u``, ``v``, ``key``, ``osmid``, ``highway``, ``oneway``,
+    ``length`` and ``geometry`` (shapely LineStrings in WGS84).
+    """
+    store = Path(store)
+    store.mkdir(parents=True, exist_ok=True)
+
+    lon = nodes["lon"].to_numpy("float64")
+    lat = nodes["lat"].to_numpy("float64")
+    x, y = coords.transform(lon, lat, coords.WGS84, crs)
+    nodes = pd.DataFrame({"osmid": nodes["osmid"].to_numpy("int64"), "x": x, "y": y, "lon": lon, "lat": lat})
+    nodes = nodes.iloc[np.argsort(zorder(x, y), kind="stable")].reset_index(drop=True)
+
+    row = pd.Series(np.arange(len(nodes), dtype="int64"), index=nodes["osmid"])
+    edges = edges[edges["u"].isin(row.index) & edges["v"].isin(row.index)]
+    urow = row.loc[edges["u"]].to_numpy()
+    vrow = row.loc[edges["v"]].to_numpy()
+    order = np.lexsort((edges["key"].to_numpy(), vrow, urow))
+    edges, urow, vrow = edges.iloc[order], urow[order], vrow[order]
+
+    geometry = shapely.transform(
+        np.asarray(edges["geometry"].array, dtype=object),
+        lambda xy: np.column_stack(coords.transform(xy[:, 0], xy[:, 1], coords.WGS84, crs)),
+    )
+    table = pd.DataFrame({
+        "u": edges["u"].to_numpy("int64"),
+        "v": edges["v"].to_numpy("int64"),
+        "key": edges["key"].to_numpy("int64"),
+        "osmid": edges["osmid"].to_numpy("int64"),
+        "highway": edges["highway"].astype("string").to_numpy(),
+        "oneway": edges["oneway"].to_numpy("bool"),
+        "length": edges["length"].to_numpy("float64"),
+        "ux": nodes["x"].to_numpy()[urow],
+        "uy": nodes["y"].to_numpy()[urow],
+        "geometry": shapely.to_wkb(geometry),
+    })
+    for name, frame in (("nodes", nodes), ("edges", table)):
+        pq.write_table(
+            pa.Table.from_pandas(frame, preserve_index=False), store / f"{name}.parquet", row_group_size=ROW_GROUP_SIZE
+        )
+
+    indptr = np.zeros(len(nodes) + 1, dtype="int64")
+    np.cumsum(np.bincount(urow, minlength=len(nodes)), out=indptr[1:])
+    np.save(store / "indptr.npy", indptr)
+    np.save(store / "indices.npy", vrow.astype("int32"))
+
+    meta = {"crs": str(crs), "source": source, "nodes": len(nodes), "edges": len(table)}
+    (store / "meta.json").write_text(json.dumps(meta, indent=2))
+    return meta
+
+
+def import_pbf(pbf, store, network_type="driving", crs=coords.LV95):
+    """Build the drive network from a local ``.osm.pbf`` file into ``store``.
+
+    Needs the optional ``pyrosm`` package; no network access is required.
+    """
+    try:
+        import pyrosm
+    except ImportError as e:
+        raise ImportError("import_pbf needs pyrosm: pip install pyrosm") from e
+
+    osm = pyrosm.OSM(str(pbf))
+    nodes, edges = osm.get_network(network_type=network_type, nodes=True)
+    nodes = pd.DataFrame({"osmid": nodes["id"], "lon": nodes["lon"], "lat": nodes["lat"]})
+    edges = pd.DataFrame(edges).rename(columns={"id": "osmid"})
+    edges["geometry"] = shapely.line_merge(np.asarray(edges["geometry"].array, dtype=object))
+    edges = _directed(edges)
+    source = {"path": str(pbf), "sha1": file_digest(pbf)}
+    return write_store(nodes, edges, store, crs=crs, source=source)
+
+
+def read_meta(store):
+    return json.loads((Path(store) / "meta.json").read_text())
+
+
+def _bbox_filter(xcol, ycol, bbox):
+    xmin, ymin, xmax, ymax = bbox
+    return [(xcol, ">=", xmin), (xcol, "<=", xmax), (ycol, ">=", ymin), (ycol, "<=", ymax)]
+
+
+def load_frames(store, bbox=None, polygon=None, geometry=True):
+    """Load the nodes and edges of ``store`` inside ``bbox`` or ``polygon``.
+
+    ``bbox`` is ``(xmin, ymin, xmax, ymax)`` and ``polygon`` a shapely
+    geometry, both in the store CRS (LV95 unless imported otherwise). Only
+    edges with both end nodes in the selection are returned, so the result
+    is a closed subgraph.
+    """
+    store = Path(store)
+    if polygon is not None:
+        bbox = polygon.bounds if bbox is None else bbox
+    nodes_filter = _bbox_filter("x", "y", bbox) if bbox is not None else None
+    nodes = pq.read_table(store / "nodes.parquet", filters=nodes_filter).to_pandas()
+    if polygon is not None:
+        shapely.prepare(polygon)
+        nodes = nodes[shapely.contains_xy(polygon, nodes["x"].to_numpy(), nodes["y"].to_numpy())]
+
+    columns = None if geometry else ["u", "v", "key", "osmid", "highway", "oneway", "length"]
+    edges_filter = _bbox_filter("ux", "uy", bbox) if bbox is not None else None
+    edges = pq.read_table(store / "edges.parquet", columns=columns, filters=edges_filter).to_pandas()
+    if bbox is not None:
+        keep = np.isin(edges["u"].to_numpy(), nodes["osmid"].to_numpy())
+        keep &= np.isin(edges["v"].to_numpy(), nodes["osmid"].to_numpy())
+        edges = edges[keep]
+    if geometry:
+        edges["geometry"] = shapely.from_wkb(edges["geometry"].to_numpy())
+    return nodes.reset_index(drop=True), edges.reset_index(drop=True)
+
+
+def load_edge_index(store, bbox=None, polygon=None):
+    """Load an :class:`~roadaccidents.snapping.EdgeIndex` straight from the store."""
+    from .snapping import EdgeIndex
+
+    _, edges = load_frames(store, bbox=bbox, polygon=polygon)
+    return EdgeIndex(edges[["u", "v", "key", "geometry"]], crs=read_meta(store)["crs"])
+
+
+def load_graph(store, bbox=None, polygon=None):
+    """Load the selection as an osmnx ``MultiDiGraph`` for existing code."""
+    import geopandas as gpd
+    import osmnx as ox
+
+    crs = read_meta(store)["crs"]
+    nodes, edges = load_frames(store, bbox=bbox, polygon=polygon)
+    gdf_nodes = gpd.GeoDataFrame(
+        nodes.set_index("osmid"), geometry=gpd.points_from_xy(nodes["x"], nodes["y"]), crs=crs
+    )
+    gdf_edges = gpd.GeoDataFrame(
+        edges.drop(columns=["ux", "uy"]).set_index(["u", "v", "key"]), geometry="geometry", crs=crs
+    )
+    return ox.graph_from_gdfs(gdf_nodes, gdf_edges, graph_attrs={"crs": crs})
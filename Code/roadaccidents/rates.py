@@ -0,0 +1,222 @@
+"""Exposure-normalised accident rates per road segment and per ``RoadType``.
+
+Raw counts favour long and busy roads. Here the accidents per segment (see
+:mod:`roadaccidents.segments`) are divided by the road length (accidents
+per km and year) and, where a traffic volume is known, by the traffic
+(accidents per million vehicle-km). Traffic volumes (AADT, vehicles per
+day) come from counting stations, e.g. the ASTRA automatic traffic counts,
+and are interpolated onto the segments of the same road type.
+
+Short or quiet segments with one or two accidents get extreme raw rates,
+so every rate is also given with empirical-Bayes smoothing: the
+method-of-moments Poisson-gamma estimate of Marshall (1991), which shrinks
+each segment towards the mean rate of its road type in proportion to how
+little exposure it has.
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.spatial import cKDTree
+
+from .aggregate import group_counts
+from .loader import ROAD_TYPES
+
+# OSM highway tag -> ASTRA RoadType (motorway, expressway, principal road, minor road,
+# motorway side installation, other)
+HIGHWAY_ROAD_TYPE = {
+    "motorway": "rt430",
+    # ramps are part of the motorway in ASTRA's RoadType; rt434 (Nebenanlage) means rest and
+    # service areas, which OSM tags as highway=services/rest_area rather than as roads
+    "motorway_link": "rt430",
+    "trunk": "rt431",
+    "trunk_link": "rt431",
+    "primary": "rt432",
+    "primary_link": "rt432",
+    "secondary": "rt432",
+    "secondary_link": "rt432",
+    "tertiary": "rt433",
+    "tertiary_link": "rt433",
+    "unclassified": "rt433",
+    "residential": "rt433",
+    "living_street": "rt433",
+    "service": "rt433",
+}
+
+
+def road_types(highway):
+    """Map OSM highway tags to ``RoadType`` codes (``rt439`` for anything else)."""
+    codes = pd.Series(np.asarray(highway, dtype=object)).map(HIGHWAY_ROAD_TYPE).fillna("rt439")
+    return pd.Categorical(codes, categories=ROAD_TYPES)
+
+
+def segment_road_types(graph, segmentation):
+    """Return the ``RoadType`` of every segment: the type covering most of its length."""
+    labels = road_types(graph.highway_labels)
+    edge_type = labels.codes[graph.highway]
+    n = len(segmentation.segments)
+    k = len(ROAD_TYPES)
+    length = np.bincount(
+        segmentation.edge_segment * k + edge_type, weights=graph.length, minlength=n * k
+    ).reshape(n, k)
+    return pd.Categorical.from_codes(length.argmax(axis=1), ROAD_TYPES)
+
+
+def interpolate_traffic(x, y, road_type, stations, k=3, max_distance=5_000, power=2.0):
+    """Inverse-distance interpolation of station AADT onto points (e.g. segment midpoints).
+
+    ``stations`` is a DataFrame with ``x``, ``y`` (LV95), ``aadt`` and
+    optionally ``road_type``; a point only uses the ``k`` nearest stations
+    of its own road type within ``max_distance``. Points without such a
+    station get NaN.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    road_type = pd.Categorical(road_type, categories=ROAD_TYPES)
+    aadt = np.full(len(x), np.nan)
+    has_type = "road_type" in stations
+    for code in ROAD_TYPES if has_type else [None]:
+        station = stations[stations["road_type"] == code] if has_type else stations
+        points = np.flatnonzero(road_type == code) if has_type else np.arange(len(x))
+        if not len(station) or not len(points):
+            continue
+        kk = min(k, len(station))
+        tree = cKDTree(station[["x", "y"]].to_numpy("float64"))
+        dist, idx = tree.query(np.column_stack([x[points], y[points]]), k=kk, distance_upper_bound=max_distance)
+        dist, idx = dist.reshape(len(points), kk), idx.reshape(len(points), kk)
+        found = np.isfinite(dist)
+        values = np.append(station["aadt"].to_numpy("float64"), np.nan)[idx]
+        weight = np.where(found, 1 / np.maximum(dist, 1.0) ** power, 0.0)
+        with np.errstate(invalid="ignore"):
+            aadt[points] = np.nansum(weight * values, axis=1) / weight.sum(axis=1)
+    return aadt
+
+
+def empirical_bayes(counts, exposure, group=None):
+    """Method-of-moments empirical-Bayes rates, shrunk towards the mean of each group.
+
+    Returns a DataFrame with the raw ``rate``, the prior ``mean`` rate of
+    the group, the ``weight`` given to the unit's own rate and the
+    smoothed ``eb_rate``. Units without exposure get NaN.
+    """
+    counts = np.asarray(counts, dtype="float64")
+    exposure = np.asarray(exposure, dtype="float64")
+    group = np.zeros(len(counts), dtype="int64") if group is None else np.asarray(group, dtype="int64")
+    valid = (exposure > 0) & (group >= 0) & np.isfinite(exposure)
+    n_groups = int(group.max()) + 1 if len(group) else 0
+    g = np.where(valid, group, 0)
+
+    def per_group(values):
+        return np.bincount(g[valid], weights=values[valid], minlength=n_groups)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(valid, counts / exposure, np.nan)
+        total_exposure = per_group(exposure)
+        mean = per_group(counts) / total_exposure
+        units = np.bincount(g[valid], minlength=n_groups)
+        average_exposure = total_exposure / units
+        deviation = np.where(valid, exposure * (rate - mean[g]) ** 2, 0.0)
+        variance = np.maximum(per_group(deviation) / total_exposure - mean / average_exposure, 0)
+        weight = np.where(valid, variance[g] / (variance[g] + mean[g] / exposure), np.nan)
+    weight = np.where(valid & (variance[g] == 0), 0.0, weight)
+    prior = np.where(valid, mean[g], np.nan)
+    return pd.DataFrame({
+        "rate": rate,
+        "mean": prior,
+        "weight": weight,
+        "eb_rate": weight * rate + (1 - weight) * prior,
+    })
+
+
+def rate_table(counts, length, years, aadt=None, road_type=None):
+    """Accidents per km and year and per million vehicle-km, raw and smoothed.
+
+    ``counts`` are the accidents per unit over ``years`` years, ``length``
+    the unit length in metres and ``aadt`` the traffic in vehicles per day
+    (NaN where unknown). Smoothing pools units of the same ``road_type``.
+    """
+    counts = np.asarray(counts, dtype="float64")
+    km_years = np.asarray(length, dtype="float64") / 1000 * years
+    group = None if road_type is None else pd.Categorical(road_type, categories=ROAD_TYPES).codes
+    per_km = empirical_bayes(counts, km_years, group)
+    table = pd.DataFrame({
+        "accidents": counts.astype("int64"),
+        "km": np.asarray(length, dtype="float64") / 1000,
+        "per_km": per_km["rate"].to_numpy(),
+        "eb_per_km": per_km["eb_rate"].to_numpy(),
+    })
+    if aadt is not None:
+        mvkm = np.asarray(aadt, dtype="float64") * 365 * km_years / 1e6
+        per_mvkm = empirical_bayes(counts, mvkm, group)
+        table["aadt"] = np.asarray(aadt, dtype="float64")
+        table["mvkm"] = mvkm
+        table["per_mvkm"] = per_mvkm["rate"].to_numpy()
+        table["eb_per_mvkm"] = per_mvkm["eb_rate"].to_numpy()
+    if road_type is not None:
+        table.insert(0, "RoadType", pd.Categorical(road_type, categories=ROAD_TYPES))
+    table.attrs["years"] = years
+    return table
+
+
+def _years(accidents, years=None):
+    """Length of the exposure period: ``years`` (a count or the list of years) or the span of all accidents."""
+    if years is not None:
+        return years if isinstance(years, (int, np.integer)) else len(list(years))
+    year = accidents["AccidentYear"].to_numpy()
+    return int(year.max() - year.min() + 1) if len(year) else 1
+
+
+def segment_rates(assignment, accidents, segmentation, graph, stations=None, mask=None, years=None, **kwargs):
+    """Rates per segment of :func:`~roadaccidents.segments.build_segments`.
+
+    ``assignment`` comes from :func:`~roadaccidents.segments.assign`;
+    ``stations`` (see :func:`interpolate_traffic`) adds the rates per
+    million vehicle-km. ``mask`` filters the accidents, so a ranking can be
+    recomputed for any subset (year, canton, accident type, ...). The
+    exposure period is ``years`` (a count or the list of years) and
+    defaults to the year span of all ``accidents``, not of the masked ones,
+    so that rates under different masks stay comparable; pass ``years``
+    when the mask selects years.
+    """
+    counts = group_counts(
+        assignment["segment"].to_numpy(), accidents, len(segmentation.segments), mask=mask, by=(), flags=(),
+        name="segment",
+    )["accidents"]
+    road_type = segment_road_types(graph, segmentation)
+    aadt = None
+    if stations is not None:
+        mid = shapely.line_interpolate_point(
+            np.asarray(segmentation.segments["geometry"].array, dtype=object), 0.5, normalized=True
+        )
+        aadt = interpolate_traffic(shapely.get_x(mid), shapely.get_y(mid), road_type, stations, **kwargs)
+    table = rate_table(counts, segmentation.segments["length"], _years(accidents, years), aadt, road_type)
+    table.index = segmentation.segments.index
+    return table
+
+
+def road_type_rates(rates, accidents=None, mask=None):
+    """Sum a :func:`segment_rates` table per ``RoadType``.
+
+    With ``accidents``, the numerator of ``per_km`` is the number of
+    accidents by their own ``RoadType`` attribute instead of the road type
+    of the segment they were assigned to. ``per_mvkm`` always uses the
+    segment counts: only accidents on segments with traffic data match the
+    ``mvkm`` exposure, and that is known per segment, not per accident.
+    """
+    columns = ["accidents", "km"] + (["mvkm"] if "mvkm" in rates else [])
+    frame = rates[columns].copy()
+    if "mvkm" in frame:
+        # segments without traffic data do not count towards the exposure or the accidents per mvkm
+        frame["accidents_mvkm"] = np.where(frame["mvkm"].notna(), frame["accidents"], 0)
+    summary = frame.groupby(rates["RoadType"], observed=False).sum(min_count=0)
+    if accidents is not None:
+        road_type = accidents["RoadType"]
+        if mask is not None:
+            road_type = road_type[np.asarray(mask, dtype=bool)]
+        summary["accidents"] = road_type.value_counts().reindex(summary.index, fill_value=0)
+    years = rates.attrs.get("years", 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        summary["per_km"] = (summary["accidents"] / (summary["km"] * years)).where(summary["km"] > 0)
+        if "mvkm" in summary:
+            summary["per_mvkm"] = (summary["accidents_mvkm"] / summary["mvkm"]).where(summary["mvkm"] > 0)
+    return summary
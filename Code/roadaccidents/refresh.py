@@ -0,0 +1,210 @@
+"""Incremental refresh when ASTRA publishes a new accident year.
+
+Every March ASTRA adds one year to ``RoadTrafficAccidentLocations.csv`` and
+occasionally corrects older records. Instead of snapping and aggregating
+all eleven years again, :func:`refresh` compares the new table with a
+manifest of row hashes from the previous run, snaps only new or changed
+accidents and updates the stored per-edge, per-segment, per-intersection
+and per-canton counts in place: the old versions of changed and removed
+accidents are subtracted, the new versions added.
+
+The state directory holds::
+
+    state.json              fingerprint of the road network, last summary
+    manifest.parquet        AccidentUID, row hash and year per accident
+    accidents.parquet       typed snapshot of the previous accident table
+    assignments.parquet     edge/segment/intersection per AccidentUID
+    counts_<level>.parquet  aggregates for edge, segment, intersection, canton
+
+If the road network (the edge index or the segmentation) differs from the
+one the state was built with, the state is rebuilt from scratch.
+
+The counts are only correct together with the manifest they were updated
+against, so a refresh never writes into the state directory: the new
+state is written to ``<state_dir>.new`` and swapped in by renaming. A run
+that stopped during the swap is completed by the next one; a run that
+stopped earlier leaves the old state untouched.
+"""
+
+import hashlib
+import json
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .aggregate import accident_edges, group_counts
+from .loader import CANTONS, CATEGORIES, FLAGS
+from .snapping import snap
+
+LEVELS = ("edge", "segment", "intersection", "canton")
+
+
+def row_hash(accidents):
+    """Return a 64-bit hash of every accident row (without the index)."""
+    return pd.util.hash_pandas_object(accidents, index=False).to_numpy()
+
+
+def network_fingerprint(index, segmentation=None):
+    """Return a digest identifying the edge ids (and segment ids) in use."""
+    digest = hashlib.sha1(str(index.crs).encode())
+    for arr in (index.u, index.v, index.key):
+        digest.update(np.ascontiguousarray(arr).tobytes())
+    if segmentation is not None:
+        digest.update(np.ascontiguousarray(segmentation.edge_segment).tobytes())
+        digest.update(np.ascontiguousarray(segmentation.intersections["node"].to_numpy()).tobytes())
+    return digest.hexdigest()
+
+
+def _column_order(columns):
+    years = sorted(col for col in columns if col.startswith("y") and col[1:].isdigit())
+    order = (
+        ["accidents"] + CATEGORIES["AccidentSeverityCategory"] + CATEGORIES["AccidentType"] + years + FLAGS
+    )
+    return [col for col in order if col in columns] + [col for col in columns if col not in order]
+
+
+def _combine(stored, add, sub):
+    columns = list(dict.fromkeys([*stored.columns, *add.columns, *sub.columns]))
+    combined = stored.reindex(columns=columns, fill_value=0)
+    combined = combined.add(add.reindex(columns=columns, fill_value=0), fill_value=0)
+    combined = combined.sub(sub.reindex(columns=columns, fill_value=0), fill_value=0)
+    return combined[_column_order(columns)].astype("int64")
+
+
+def _assign(accidents, index, segmentation):
+    snapped = snap(accidents, index)
+    assignment = snapped.reindex(accidents["AccidentUID"].to_numpy())
+    assignment["edge"] = accident_edges(snapped, accidents, index.edges)
+    if segmentation is not None:
+        from .segments import assign
+
+        zones = assign(accidents, segmentation)
+        assignment["intersection"] = zones["intersection"].to_numpy()
+        assignment["segment"] = zones["segment"].to_numpy()
+    return assignment
+
+
+def _sizes(index, segmentation):
+    sizes = {"edge": len(index), "canton": len(CANTONS)}
+    if segmentation is not None:
+        sizes["segment"] = len(segmentation.segments)
+        sizes["intersection"] = len(segmentation.intersections)
+    return sizes
+
+
+def _groups(level, accidents, assignment):
+    if level == "canton":
+        return accidents["CantonCode"].cat.codes.to_numpy("int64")
+    if level not in assignment:
+        return np.full(len(accidents), -1, dtype="int64")
+    return assignment[level].fillna(-1).to_numpy("int64")
+
+
+def _recover(state_dir):
+    """Finish or discard a swap of the state directory that was interrupted."""
+    staged = state_dir.with_name(state_dir.name + ".new")
+    old = state_dir.with_name(state_dir.name + ".old")
+    if staged.exists():
+        # state.json is written last, so without it the staged state is incomplete
+        if not state_dir.exists() and (staged / "state.json").exists():
+            staged.replace(state_dir)
+        else:
+            shutil.rmtree(staged)
+    if old.exists() and state_dir.exists():
+        shutil.rmtree(old)
+
+
+def _swap(staged, state_dir):
+    old = state_dir.with_name(state_dir.name + ".old")
+    if state_dir.exists():
+        state_dir.replace(old)
+    staged.replace(state_dir)
+    if old.exists():
+        shutil.rmtree(old)
+
+
+def load_aggregates(state_dir):
+    """Return the stored aggregates as ``{level: DataFrame}``."""
+    state_dir = Path(state_dir)
+    _recover(state_dir)
+    return {
+        level: pd.read_parquet(state_dir / f"counts_{level}.parquet")
+        for level in LEVELS
+        if (state_dir / f"counts_{level}.parquet").exists()
+    }
+
+
+def refresh(accidents, state_dir, index, segmentation=None):
+    """Bring the stored assignments and aggregates up to date with ``accidents``.
+
+    ``accidents`` is the full, newly loaded table; only rows whose
+    ``AccidentUID`` is new or whose content changed are snapped. Returns a
+    summary with the number of new, changed and removed accidents and the
+    years they belong to.
+    """
+    state_dir = Path(state_dir)
+    _recover(state_dir)
+    fingerprint = network_fingerprint(index, segmentation)
+    state_file = state_dir / "state.json"
+    state = json.loads(state_file.read_text()) if state_file.exists() else {}
+    full = state.get("fingerprint") != fingerprint
+
+    uid = accidents["AccidentUID"].to_numpy()
+    hashes = row_hash(accidents)
+    if full:
+        old_hash = pd.Series(dtype="uint64")
+        old_accidents = accidents.iloc[:0]
+        old_assignment = pd.DataFrame()
+        stored = {}
+    else:
+        manifest = pd.read_parquet(state_dir / "manifest.parquet")
+        old_hash = pd.Series(manifest["hash"].to_numpy(), index=manifest["AccidentUID"].to_numpy())
+        old_accidents = pd.read_parquet(state_dir / "accidents.parquet")
+        old_assignment = pd.read_parquet(state_dir / "assignments.parquet")
+        stored = load_aggregates(state_dir)
+
+    previous = old_hash.reindex(uid)
+    is_new = previous.isna().to_numpy()
+    is_changed = ~is_new & (previous.to_numpy() != hashes)
+    process = accidents[is_new | is_changed]
+    outdated = ~old_accidents["AccidentUID"].isin(pd.Index(uid[~(is_new | is_changed)]))
+    old_rows = old_accidents[outdated.to_numpy()]
+
+    assignment = _assign(process, index, segmentation)
+    old_rows_assignment = old_assignment.reindex(old_rows["AccidentUID"].to_numpy())
+
+    counts = {}
+    for level, size in _sizes(index, segmentation).items():
+        add = group_counts(_groups(level, process, assignment), process, size, name=level)
+        sub = group_counts(_groups(level, old_rows, old_rows_assignment), old_rows, size, name=level)
+        base = stored.get(level, pd.DataFrame(index=pd.RangeIndex(size, name=level)))
+        counts[level] = _combine(base, add, sub)
+
+    kept = old_assignment.drop(index=old_rows["AccidentUID"].to_numpy(), errors="ignore")
+    assignments = pd.concat([kept, assignment]).reindex(uid)
+    manifest = pd.DataFrame({"AccidentUID": uid, "hash": hashes, "AccidentYear": accidents["AccidentYear"].to_numpy()})
+
+    removed = len(old_rows) - int(is_changed.sum())
+    summary = {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "full": full,
+        "accidents": len(accidents),
+        "new": int(is_new.sum()),
+        "changed": int(is_changed.sum()),
+        "removed": removed,
+        "years": sorted(int(y) for y in np.unique(process["AccidentYear"].to_numpy())),
+    }
+
+    staged = state_dir.with_name(state_dir.name + ".new")
+    staged.mkdir(parents=True)
+    for level, table in counts.items():
+        table.to_parquet(staged / f"counts_{level}.parquet")
+    assignments.to_parquet(staged / "assignments.parquet")
+    accidents.to_parquet(staged / "accidents.parquet", index=False)
+    manifest.to_parquet(staged / "manifest.parquet", index=False)
+    (staged / "state.json").write_text(json.dumps({"fingerprint": fingerprint, "last": summary}, indent=2))
+    _swap(staged, state_dir)
+    return summary
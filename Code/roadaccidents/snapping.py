@@ -0,0 +1,158 @@
+"""Snap accidents to the nearest edge of a projected road network.
+
+``ox.nearest_edges`` rebuilds its index on every call and is slow on large
+graphs. :class:`EdgeIndex` builds one STRtree over the edge geometries, can
+be saved next to the accident cache and answers the nearest-edge query for
+all accidents in a single bulk call. The edges are kept in LV95 by default,
+which is also the CRS of the accident coordinates, so no reprojection of
+the points is necessary.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from . import coords
+
+SNAP_COLUMNS = ["u", "v", "key", "distance", "offset"]
+
+
+def nearest(tree, x, y, max_distance=None, chunk_size=200_000):
+    """Bulk nearest-neighbour query of the points ``x``/``y`` against ``tree``.
+
+    Returns ``(point, item, distance)`` arrays, where ``item`` indexes the
+    geometries of the STRtree. Points with nothing within ``max_distance``
+    are left out; ties go to the lowest item.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    points_out, items_out, dist_out = [], [], []
+    for start in range(0, len(x), chunk_size):
+        points = shapely.points(x[start:start + chunk_size], y[start:start + chunk_size])
+        (pidx, iidx), dist = tree.query_nearest(
+            points, max_distance=max_distance, return_distance=True, all_matches=True
+        )
+        order = np.lexsort((iidx, pidx))
+        pidx, iidx, dist = pidx[order], iidx[order], dist[order]
+        first = np.ones(len(pidx), dtype=bool)
+        first[1:] = pidx[1:] != pidx[:-1]
+        points_out.append(pidx[first] + start)
+        items_out.append(iidx[first])
+        dist_out.append(dist[first])
+    if not points_out:
+        return np.empty(0, "int64"), np.empty(0, "int64"), np.empty(0, "float64")
+    return np.concatenate(points_out), np.concatenate(items_out), np.concatenate(dist_out)
+
+
+def _first_of_twins(u, v, geometry):
+    """Mask of the edges that are not the reverse twin of an earlier edge.
+
+    Twins connect the same two nodes with the same line in opposite
+    directions; each geometry is keyed by the smaller of its WKB and the
+    WKB of its reverse, so both twins get the same key.
+    """
+    forward = shapely.to_wkb(geometry)
+    backward = shapely.to_wkb(shapely.reverse(geometry))
+    line = np.where(forward <= backward, forward, backward)
+    key = pd.DataFrame({"a": np.minimum(u, v), "b": np.maximum(u, v), "line": line})
+    return ~key.duplicated().to_numpy()
+
+
+class EdgeIndex:
+    """STRtree over the edges of a projected road network.
+
+    ``edges`` is a DataFrame with the columns ``u``, ``v``, ``key`` and
+    ``geometry`` (LineStrings in ``crs``). Edges are sorted by
+    ``(u, v, key)`` so that ties are always resolved the same way.
+
+    A two-way street is stored as two directed edges with reversed
+    geometries, whose distances to a point differ only by round-off. Only
+    the first edge of such a pair in ``(u, v, key)`` order is put into the
+    tree, so all accidents on the street go to the same edge; ``tree_edges``
+    maps the tree items back to edge rows.
+    """
+
+    def __init__(self, edges, crs=coords.LV95):
+        edges = pd.DataFrame(edges)
+        if not {"u", "v", "key"} <= set(edges.columns):
+            edges = edges.reset_index()
+        edges = edges.sort_values(["u", "v", "key"], kind="stable").reset_index(drop=True)
+        self.edges = edges
+        self.crs = crs
+        self.u = edges["u"].to_numpy("int64")
+        self.v = edges["v"].to_numpy("int64")
+        self.key = edges["key"].to_numpy("int64")
+        self.geometry = np.asarray(edges["geometry"].array, dtype=object)
+        self.tree_edges = np.flatnonzero(_first_of_twins(self.u, self.v, self.geometry))
+        self.tree = shapely.STRtree(self.geometry[self.tree_edges])
+
+    def __len__(self):
+        return len(self.geometry)
+
+    @classmethod
+    def from_graph(cls, G, crs=coords.LV95):
+        """Build the index from an osmnx graph, projecting it to ``crs``."""
+        import osmnx as ox
+
+        G = ox.project_graph(G, to_crs=crs)
+        edges = ox.graph_to_gdfs(G, nodes=False).reset_index()
+        return cls(edges[["u", "v", "key", "geometry"]], crs=crs)
+
+    def save(self, path):
+        """Write the edges as Parquet; the tree is rebuilt by :meth:`load`."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        table = pd.DataFrame({
+            "u": self.u,
+            "v": self.v,
+            "key": self.key,
+            "geometry": shapely.to_wkb(self.geometry),
+        })
+        table.attrs["crs"] = str(self.crs)
+        table.to_parquet(path, index=False)
+
+    @classmethod
+    def load(cls, path):
+        table = pd.read_parquet(path)
+        table["geometry"] = shapely.from_wkb(table["geometry"].to_numpy())
+        return cls(table, crs=table.attrs.get("crs", coords.LV95))
+
+    def nearest(self, x, y, max_distance=None):
+        """Return ``(point, edge, distance)`` arrays for the nearest edges.
+
+        ``point`` indexes into ``x``/``y`` and ``edge`` into the sorted edge
+        table. Points without an edge within ``max_distance`` are left out.
+        Of the two directed edges of a two-way street only the first in
+        ``(u, v, key)`` order is returned; when different edges are equally
+        close, the first edge in ``(u, v, key)`` order wins.
+        """
+        point, item, distance = nearest(self.tree, x, y, max_distance=max_distance)
+        return point, self.tree_edges[item], distance
+
+    def offsets(self, edge, x, y):
+        """Return the distance along ``edge`` of the projection of each point."""
+        return shapely.line_locate_point(self.geometry[edge], shapely.points(x, y))
+
+
+def snap(accidents, index, max_distance=None):
+    """Snap every accident to its nearest edge.
+
+    Returns a DataFrame indexed by ``AccidentUID`` with the columns ``u``,
+    ``v``, ``key``, ``distance`` and ``offset`` (position along the edge, in
+    CRS units). Accidents farther than ``max_distance`` from every edge are
+    not part of the result.
+    """
+    x, y = coords.projected_xy(accidents, index.crs)
+    point, edge, distance = index.nearest(x, y, max_distance=max_distance)
+    return pd.DataFrame(
+        {
+            "u": index.u[edge],
+            "v": index.v[edge],
+            "key": index.key[edge],
+            "distance": distance,
+            "offset": index.offsets(edge, x[point], y[point]),
+        },
+        index=pd.Index(accidents["AccidentUID"].to_numpy()[point], name="AccidentUID"),
+    )
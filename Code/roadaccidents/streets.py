@@ -0,0 +1,118 @@
+"""Street-level aggregation on the Amtliches Strassenverzeichnis.
+
+Merging the accidents with the street directory on equal coordinates (see
+``Problems``) counts an accident once per street that shares those
+coordinates. Here every accident is assigned to exactly one street: the
+nearest street line within ``max_distance``. Streets with identical
+geometry are collapsed onto one entry first, ties are broken by the lowest
+``STR_ESID``, and accidents whose second-nearest street lies within
+``tolerance`` of the nearest one are flagged as ambiguous instead of being
+counted twice.
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from . import coords
+from .aggregate import group_counts
+from .snapping import nearest
+
+ID = "STR_ESID"
+LABEL = "STN_LABEL"
+MUNICIPALITY = "COM_FOSNR"
+
+
+def read_directory(path, columns=(ID, LABEL, MUNICIPALITY, "COM_NAME", "COM_CANTON"), **kwargs):
+    """Read the street lines of the directory (GeoPackage or shapefile) in LV95."""
+    import geopandas as gpd
+
+    streets = gpd.read_file(path, **kwargs).to_crs(coords.LV95)
+    streets = streets[streets.geom_type.isin(["LineString", "MultiLineString"])]
+    keep = [col for col in columns if col in streets.columns]
+    return streets[keep + ["geometry"]].sort_values(ID, kind="stable").reset_index(drop=True)
+
+
+class StreetIndex:
+    """STRtree over the distinct street geometries of the directory.
+
+    ``streets`` holds one row per distinct geometry (the entry with the
+    lowest id); ``duplicates`` maps every directory entry to that row.
+    """
+
+    def __init__(self, directory, crs=coords.LV95):
+        directory = directory.sort_values(ID, kind="stable").reset_index(drop=True)
+        wkb = shapely.to_wkb(np.asarray(directory.geometry.array, dtype=object))
+        codes, _ = pd.factorize(pd.Series(wkb), sort=False)
+        first = pd.Series(np.arange(len(codes))).groupby(codes).min().to_numpy()
+        self.streets = pd.DataFrame(directory.drop(columns="geometry").iloc[first]).reset_index(drop=True)
+        self.geometry = np.asarray(directory.geometry.array, dtype=object)[first]
+        self.duplicates = pd.Series(codes, index=directory[ID].to_numpy(), name="street")
+        self.crs = crs
+        self.tree = shapely.STRtree(self.geometry)
+
+    def __len__(self):
+        return len(self.geometry)
+
+    @property
+    def n_duplicates(self):
+        """Number of directory entries merged into another entry's geometry."""
+        return len(self.duplicates) - len(self)
+
+
+def assign_streets(accidents, index, max_distance=50, tolerance=1.0):
+    """Assign every accident to exactly one street.
+
+    Returns a DataFrame indexed by ``AccidentUID`` with the ``street`` row
+    (``-1`` if no street is within ``max_distance``), its id and label, the
+    ``distance``, the number of ``candidates`` within ``distance +
+    tolerance`` and an ``ambiguous`` flag when there is more than one.
+    """
+    x, y = coords.projected_xy(accidents, index.crs)
+    street = np.full(len(x), -1, dtype="int64")
+    distance = np.full(len(x), np.nan)
+    candidates = np.zeros(len(x), dtype="int64")
+
+    point, item, dist = nearest(index.tree, x, y, max_distance=max_distance)
+    street[point] = item
+    distance[point] = dist
+
+    near = index.tree.query(shapely.points(x[point], y[point]), predicate="dwithin", distance=dist + tolerance)
+    candidates[point] = np.bincount(near[0], minlength=len(point))
+
+    # street -1 is not in the index, so unmatched accidents get NA here
+    info = index.streets[[col for col in (ID, LABEL) if col in index.streets]].reindex(street)
+    frame = pd.DataFrame(
+        {"street": street, "distance": distance, "candidates": candidates, "ambiguous": candidates > 1}
+    )
+    frame = pd.concat([frame, info.reset_index(drop=True)], axis=1)
+    frame.index = pd.Index(accidents["AccidentUID"].to_numpy(), name="AccidentUID")
+    return frame
+
+
+def ambiguity_report(assignment):
+    """Summarise how many accidents were assigned, unmatched or ambiguous."""
+    matched = assignment["street"] >= 0
+    return {
+        "accidents": len(assignment),
+        "assigned": int(matched.sum()),
+        "unmatched": int((~matched).sum()),
+        "ambiguous": int(assignment["ambiguous"].sum()),
+    }
+
+
+def street_counts(assignment, accidents, index, mask=None, include_ambiguous=True):
+    """Accident counts per street; every accident is counted at most once."""
+    street = assignment["street"].to_numpy()
+    if not include_ambiguous:
+        street = np.where(assignment["ambiguous"].to_numpy(), -1, street)
+    counts = group_counts(street, accidents, len(index), mask=mask, name="street")
+    return index.streets.join(counts)
+
+
+def to_geodataframe(counts, index, min_accidents=1):
+    """Attach the street geometry to the streets with accidents."""
+    import geopandas as gpd
+
+    rows = np.flatnonzero(counts["accidents"].to_numpy() >= min_accidents)
+    return gpd.GeoDataFrame(counts.iloc[rows], geometry=index.geometry[rows], crs=index.crs)
@@ -0,0 +1,111 @@
+"""Synthetic road graphs and accidents following the ASTRA schema.
+
+Used by the benchmarks in ``Code/benchmarks`` so that every pipeline stage
+can be timed at city, canton and national scale without the real data.
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from . import coords
+from .csrgraph import CSRGraph
+from .loader import CATEGORIES, FLAGS, LABELLED, LANGUAGES
+
+# lower left corner of the synthetic networks, roughly Lucerne
+ORIGIN = (2_640_000.0, 1_190_000.0)
+
+# (nodes per side, spacing in metres); about 10k, 160k and 1M nodes
+GRAPH_SIZES = {
+    "city": (100, 80.0),
+    "canton": (400, 100.0),
+    "national": (1000, 200.0),
+}
+
+# column order of the ASTRA CSV
+COLUMNS = [
+    "AccidentUID", "AccidentType", "AccidentSeverityCategory", *FLAGS, "RoadType",
+    "AccidentLocation_CHLV95_E", "AccidentLocation_CHLV95_N", "CantonCode", "MunicipalityCode",
+    "AccidentYear", "AccidentMonth", "AccidentWeekDay", "AccidentHour",
+]
+
+
+def road_graph(side, spacing, seed=0, drop=0.15, origin=ORIGIN):
+    """Return a jittered grid network as a :class:`CSRGraph` in LV95.
+
+    A share ``drop`` of the grid links is removed so that node degrees vary
+    like in a real network; every remaining link is a two-way street.
+    """
+    rng = np.random.default_rng(seed)
+    i, j = np.meshgrid(np.arange(side), np.arange(side), indexing="ij")
+    i, j = i.ravel(), j.ravel()
+    x = origin[0] + i * spacing + rng.normal(0, spacing / 8, len(i))
+    y = origin[1] + j * spacing + rng.normal(0, spacing / 8, len(j))
+    node = i * side + j
+
+    right = node[i < side - 1]
+    up = node[j < side - 1]
+    a = np.concatenate([right, up])
+    b = np.concatenate([right + side, up + 1])
+    keep = rng.random(len(a)) >= drop
+    a, b = a[keep], b[keep]
+
+    u = np.concatenate([a, b])
+    v = np.concatenate([b, a])
+    ends = np.column_stack([x[u], y[u], x[v], y[v]]).reshape(-1, 2, 2)
+    geometry = shapely.linestrings(ends)
+    highway = rng.choice(["primary", "secondary", "residential"], len(u) // 2, p=[0.1, 0.3, 0.6])
+    return CSRGraph._build(
+        osmid=node + 1, x=x, y=y, u=u, v=v, key=np.zeros(len(u), dtype="int64"),
+        length=shapely.length(geometry), highway=np.concatenate([highway, highway]),
+        geometry=geometry, crs=coords.LV95,
+    )
+
+
+def accidents(n, graph=None, seed=0, jitter=8.0, years=(2011, 2021)):
+    """Return ``n`` synthetic accidents with the dtypes of :func:`load_accidents`.
+
+    With a ``graph`` the accidents lie along its edges (plus ``jitter``
+    metres of noise), otherwise they are spread over the Swiss bounding box.
+    """
+    rng = np.random.default_rng(seed)
+    if graph is not None:
+        edge = rng.integers(0, graph.n_edges, n)
+        t = rng.random(n)
+        e = graph.x[graph.u[edge]] * (1 - t) + graph.x[graph.v[edge]] * t + rng.normal(0, jitter, n)
+        north = graph.y[graph.u[edge]] * (1 - t) + graph.y[graph.v[edge]] * t + rng.normal(0, jitter, n)
+    else:
+        e = rng.uniform(2_485_000, 2_834_000, n)
+        north = rng.uniform(1_075_000, 1_296_000, n)
+
+    df = pd.DataFrame({"AccidentUID": pd.array([f"{k:032X}" for k in range(n)], dtype="string")})
+    for col, categories in CATEGORIES.items():
+        df[col] = pd.Categorical.from_codes(rng.integers(0, len(categories), n), categories)
+    # severities in the real data are heavily skewed towards light injuries
+    severity = rng.choice(["as1", "as2", "as3"], n, p=[0.015, 0.2, 0.785])
+    df["AccidentSeverityCategory"] = pd.Categorical(severity, categories=CATEGORIES["AccidentSeverityCategory"])
+    for flag in FLAGS:
+        df[flag] = rng.random(n) < 0.15
+    df["AccidentLocation_CHLV95_E"] = np.round(e)
+    df["AccidentLocation_CHLV95_N"] = np.round(north)
+    df["MunicipalityCode"] = pd.array(rng.integers(1, 7000, n), dtype="Int32")
+    df["AccidentYear"] = np.sort(rng.integers(years[0], years[1], n)).astype("int16")
+    df["AccidentMonth"] = rng.integers(1, 13, n).astype("int8")
+    df["AccidentHour"] = pd.array(rng.integers(0, 24, n), dtype="Int8")
+    return coords.add_wgs84(df.reindex(columns=COLUMNS))
+
+
+def write_astra_csv(df, path):
+    """Write ``df`` in the layout of ``RoadTrafficAccidentLocations.csv``.
+
+    The per-language label columns are filled with placeholder text so that
+    parsing costs about as much as with the real file.
+    """
+    out = df.drop(columns=[coords.WGS84_E, coords.WGS84_N], errors="ignore").copy()
+    for col in LABELLED:
+        for lang in LANGUAGES:
+            out[f"{col}_{lang}"] = out[col].astype(str) + f" ({lang})"
+    out["AccidentHour_text"] = out["AccidentHour"].astype(str) + "h"
+    for flag in FLAGS:
+        out[flag] = np.where(out[flag], "true", "false")
+    out.to_csv(path, index=False)
@@ -0,0 +1,438 @@
+"""Mapbox Vector Tile export of accident points, edges and hot spot layers.
+
+``.explore()`` and Folium embed every geometry as GeoJSON in one HTML
+file, which a browser cannot handle for the whole country. This module
+cuts the layers into a tile pyramid in Web Mercator instead, as MBTiles
+(SQLite) or as a ``z/x/y.pbf`` directory, which MapLibre, Leaflet
+(VectorGrid) or QGIS load tile by tile.
+
+Per zoom level, lines and polygons are simplified to the tile resolution
+and features smaller than ``min_size`` pixels are dropped. Point layers
+keep at most one point per ``thin`` pixel cell below their ``maxzoom``,
+preferring the points with the highest ``priority`` (e.g. severity). The
+tiles of a zoom level are encoded in worker processes. The protobuf
+encoding of the MVT 2.1 specification is written out here, so no extra
+dependency is needed.
+"""
+
+import gzip
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from . import coords
+
+WEB_MERCATOR = "EPSG:3857"
+# half the circumference of the earth in Web Mercator metres
+ORIGIN_SHIFT = 20037508.342789244
+EXTENT = 4096
+BUFFER = 64
+TILES_PER_TASK = 128
+
+
+class TileLayer:
+    """One layer of the tile pyramid.
+
+    ``geometry`` is an array of shapely geometries in ``crs`` and
+    ``properties`` a DataFrame with the attributes to write, one row per
+    geometry.
+    """
+
+    def __init__(self, name, geometry, properties=None, crs=coords.LV95, minzoom=0, maxzoom=14,
+                 priority=None, simplify=1.0, min_size=0.5, thin=4):
+        geometry = np.asarray(geometry, dtype=object)
+        if properties is None:
+            properties = pd.DataFrame(index=range(len(geometry)))
+        self.name = name
+        self.geometry = _to_mercator(geometry, crs)
+        self.properties = properties.reset_index(drop=True)
+        self.minzoom = minzoom
+        self.maxzoom = maxzoom
+        self.priority = np.zeros(len(geometry)) if priority is None else np.asarray(priority, dtype="float64")
+        self.simplify = simplify
+        self.min_size = min_size
+        self.thin = thin
+        self.is_point = bool(len(geometry)) and bool(
+            np.isin(shapely.get_type_id(self.geometry), [0, 4]).all()
+        )
+
+    def __repr__(self):
+        return f"TileLayer({self.name!r}, {len(self.geometry)} features, z{self.minzoom}-{self.maxzoom})"
+
+    @classmethod
+    def from_frame(cls, name, frame, columns=None, **kwargs):
+        """Build a layer from a GeoDataFrame or from an accident table (LV95 points)."""
+        if hasattr(frame, "geometry") and hasattr(frame, "crs"):
+            geometry = np.asarray(frame.geometry.array, dtype=object)
+            kwargs.setdefault("crs", frame.crs.to_string() if frame.crs is not None else coords.LV95)
+            frame = pd.DataFrame(frame.drop(columns=frame.geometry.name))
+        else:
+            geometry = shapely.points(*coords.lv95_xy(frame))
+            kwargs.setdefault("crs", coords.LV95)
+        columns = list(frame.columns) if columns is None else list(columns)
+        if isinstance(kwargs.get("priority"), str):
+            kwargs["priority"] = frame[kwargs["priority"]].to_numpy("float64")
+        return cls(name, geometry, frame[columns], **kwargs)
+
+    def fields(self):
+        """Field types as listed in the TileJSON ``vector_layers``."""
+        types = {}
+        for col, dtype in self.properties.dtypes.items():
+            if pd.api.types.is_bool_dtype(dtype):
+                types[col] = "Boolean"
+            elif pd.api.types.is_numeric_dtype(dtype):
+                types[col] = "Number"
+            else:
+                types[col] = "String"
+        return types
+
+
+def _to_mercator(geometry, crs):
+    if str(crs) == WEB_MERCATOR:
+        return geometry
+
+    def project(xy):
+        x, y = coords.transform(xy[:, 0], xy[:, 1], crs, WEB_MERCATOR)
+        return np.column_stack([x, y])
+
+    return shapely.transform(geometry, project)
+
+
+def tile_size(z):
+    """Edge length of a tile at zoom ``z`` in Web Mercator metres."""
+    return 2 * ORIGIN_SHIFT / 2**z
+
+
+# --- protobuf encoding -------------------------------------------------------
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _pack(values):
+    """Encode non-negative integers as concatenated varints (a packed repeated field)."""
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35):
+        n_bytes += values >= np.uint64(1 << shift)
+    position = np.arange(n_bytes.sum()) - np.repeat(np.cumsum(n_bytes) - n_bytes, n_bytes)
+    value = np.repeat(values, n_bytes)
+    byte = (value >> (position * 7).astype(np.uint64)) & np.uint64(0x7F)
+    more = position < np.repeat(n_bytes - 1, n_bytes)
+    return (byte | (more.astype(np.uint64) << np.uint64(7))).astype(np.uint8).tobytes()
+
+
+def _zigzag(values):
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _field(number, payload):
+    """Length-delimited field."""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _uint_field(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def _value(v):
+    if isinstance(v, (bool, np.bool_)):
+        return _uint_field(7, int(v))
+    if isinstance(v, (int, np.integer)):
+        return _uint_field(6, int(_zigzag([v])[0]))
+    if isinstance(v, (float, np.floating)):
+        return _varint(3 << 3 | 1) + np.float64(v).tobytes()
+    return _field(1, str(v).encode())
+
+
+def _command(command, count):
+    return command | count << 3
+
+
+def _geometry(geom):
+    """Return the MVT type and the command integers of a tile-space geometry, or None if empty."""
+    kind = shapely.get_type_id(geom)
+    if kind == 7:
+        # clipping can return a collection: keep the parts of the highest dimension
+        parts = shapely.get_parts(shapely.get_parts(geom))
+        if not len(parts):
+            return None
+        dims = shapely.get_dimensions(parts)
+        parts = parts[dims == dims.max()]
+        geom = [shapely.multipoints, shapely.multilinestrings, shapely.multipolygons][dims.max()](parts)
+        kind = shapely.get_type_id(geom)
+    if kind in (0, 4):
+        xy = shapely.get_coordinates(geom).astype(np.int64)
+        if not len(xy):
+            return None
+        deltas = np.diff(np.vstack([[0, 0], xy]), axis=0)
+        return 1, [np.array([_command(1, len(xy))], dtype=np.uint64), _zigzag(deltas.ravel())]
+
+    sequences = []
+    if kind in (1, 5):
+        for part in shapely.get_parts(geom):
+            xy = shapely.get_coordinates(part).astype(np.int64)
+            xy = xy[np.r_[True, (np.diff(xy, axis=0) != 0).any(axis=1)]]
+            if len(xy) >= 2:
+                sequences.append((xy, False))
+        mvt_type = 2
+    elif kind in (3, 6):
+        for polygon in shapely.get_parts(geom):
+            rings = [shapely.get_exterior_ring(polygon)] + [
+                shapely.get_interior_ring(polygon, i) for i in range(shapely.get_num_interior_rings(polygon))
+            ]
+            for i, ring in enumerate(rings):
+                xy = shapely.get_coordinates(ring).astype(np.int64)
+                xy = xy[np.r_[True, (np.diff(xy, axis=0) != 0).any(axis=1)]]
+                if len(xy) >= 4:
+                    sequences.append((xy, True))
+                elif i == 0:
+                    break
+        mvt_type = 3
+    else:
+        return None
+    if not sequences:
+        return None
+
+    out = []
+    cursor = np.zeros(2, dtype=np.int64)
+    for xy, closed in sequences:
+        points = xy[:-1] if closed else xy
+        deltas = np.diff(np.vstack([cursor, points]), axis=0)
+        out.append(np.array([_command(1, 1)], dtype=np.uint64))
+        out.append(_zigzag(deltas[0]))
+        out.append(np.array([_command(2, len(points) - 1)], dtype=np.uint64))
+        out.append(_zigzag(deltas[1:].ravel()))
+        if closed:
+            out.append(np.array([_command(7, 1)], dtype=np.uint64))
+        cursor = points[-1]
+    return mvt_type, out
+
+
+def _encode_layer(name, geometry, ids, columns, rows):
+    keys, values, key_index, value_index = [], [], {}, {}
+    features = bytearray()
+    for geom, fid, row in zip(geometry, ids, rows):
+        encoded = _geometry(geom)
+        if encoded is None:
+            continue
+        mvt_type, commands = encoded
+        tags = []
+        for col, v in zip(columns, row):
+            if v is None or (isinstance(v, float) and np.isnan(v)) or v is pd.NA:
+                continue
+            if col not in key_index:
+                key_index[col] = len(keys)
+                keys.append(col)
+            value = _value(v)
+            if value not in value_index:
+                value_index[value] = len(values)
+                values.append(value)
+            tags += [key_index[col], value_index[value]]
+        feature = _uint_field(1, int(fid)) + _field(2, _pack(tags)) + _uint_field(3, mvt_type)
+        feature += _field(4, _pack(np.concatenate(commands)))
+        features += _field(2, feature)
+    if not features:
+        return b""
+    layer = _uint_field(15, 2) + _field(1, name.encode()) + bytes(features)
+    layer += b"".join(_field(3, k.encode()) for k in keys)
+    layer += b"".join(_field(4, v) for v in values)
+    layer += _uint_field(5, EXTENT)
+    return _field(3, layer)
+
+
+def _encode_tiles(task):
+    z, tiles, compress = task
+    size = tile_size(z)
+    scale = EXTENT / size
+    pad = BUFFER / scale
+    out = []
+    for x, y, layers in tiles:
+        minx = -ORIGIN_SHIFT + x * size
+        maxy = ORIGIN_SHIFT - y * size
+        data = bytearray()
+        for name, wkb, ids, columns, rows, is_point in layers:
+            geometry = shapely.from_wkb(wkb)
+            if not is_point:
+                geometry = shapely.clip_by_rect(geometry, minx - pad, maxy - size - pad, minx + size + pad, maxy + pad)
+
+            def to_tile(xy):
+                return np.round(np.column_stack([(xy[:, 0] - minx) * scale, (maxy - xy[:, 1]) * scale]))
+
+            geometry = shapely.transform(geometry, to_tile)
+            # positive area in tile coordinates, i.e. clockwise on screen
+            geometry = shapely.orient_polygons(geometry, exterior_cw=False)
+            data += _encode_layer(name, geometry, ids, columns, rows)
+        if data:
+            out.append((x, y, gzip.compress(bytes(data)) if compress else bytes(data)))
+    return z, out
+
+
+# --- tiling ------------------------------------------------------------------
+
+
+def _select(layer, z):
+    """Features of ``layer`` shown at zoom ``z`` and their simplified geometry."""
+    resolution = tile_size(z) / EXTENT
+    n = len(layer.geometry)
+    if layer.is_point:
+        keep = np.arange(n)
+        if z < layer.maxzoom and layer.thin:
+            xy = shapely.get_coordinates(layer.geometry)
+            cell = layer.thin * resolution
+            key = np.floor(xy[:, 0] / cell).astype(np.int64) * (1 << 32) + np.floor(xy[:, 1] / cell).astype(np.int64)
+            order = np.lexsort((np.arange(n), -layer.priority, key))
+            first = np.ones(n, dtype=bool)
+            first[1:] = key[order][1:] != key[order][:-1]
+            keep = np.sort(order[first])
+        return keep, layer.geometry[keep]
+
+    bounds = shapely.bounds(layer.geometry)
+    extent = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1])
+    keep = np.flatnonzero(extent >= layer.min_size * resolution) if z < layer.maxzoom else np.arange(n)
+    geometry = layer.geometry[keep]
+    if layer.simplify:
+        geometry = shapely.simplify(geometry, layer.simplify * resolution, preserve_topology=True)
+    return keep, geometry
+
+
+def _tile_ranges(geometry, z):
+    size = tile_size(z)
+    n = 2**z
+    bounds = shapely.bounds(geometry)
+    x0 = np.clip(np.floor((bounds[:, 0] + ORIGIN_SHIFT) / size), 0, n - 1).astype(np.int64)
+    x1 = np.clip(np.floor((bounds[:, 2] + ORIGIN_SHIFT) / size), 0, n - 1).astype(np.int64)
+    y0 = np.clip(np.floor((ORIGIN_SHIFT - bounds[:, 3]) / size), 0, n - 1).astype(np.int64)
+    y1 = np.clip(np.floor((ORIGIN_SHIFT - bounds[:, 1]) / size), 0, n - 1).astype(np.int64)
+    return x0, x1, y0, y1
+
+
+def _tasks(layers, z, compress):
+    """Group the features of every layer by tile and cut the tiles into worker tasks."""
+    per_tile = {}
+    for layer in layers:
+        if not layer.minzoom <= z <= layer.maxzoom or not len(layer.geometry):
+            continue
+        keep, geometry = _select(layer, z)
+        x0, x1, y0, y1 = _tile_ranges(geometry, z)
+        nx, ny = x1 - x0 + 1, y1 - y0 + 1
+        feature = np.repeat(np.arange(len(keep)), nx * ny)
+        k = np.arange(len(feature)) - np.repeat(np.cumsum(nx * ny) - nx * ny, nx * ny)
+        tx = x0[feature] + k % nx[feature]
+        ty = y0[feature] + k // nx[feature]
+        order = np.lexsort((feature, ty, tx))
+        feature, tx, ty = feature[order], tx[order], ty[order]
+        bounds = np.flatnonzero(np.r_[True, (tx[1:] != tx[:-1]) | (ty[1:] != ty[:-1]), True])
+        wkb = shapely.to_wkb(geometry)
+        columns = list(layer.properties.columns)
+        records = list(layer.properties.itertuples(index=False, name=None))
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            f = feature[start:stop]
+            rows = keep[f]
+            per_tile.setdefault((int(tx[start]), int(ty[start])), []).append(
+                (layer.name, wkb[f], rows, columns, [records[r] for r in rows], layer.is_point)
+            )
+    tiles = [(x, y, layer_data) for (x, y), layer_data in sorted(per_tile.items())]
+    for start in range(0, len(tiles), TILES_PER_TASK):
+        yield z, tiles[start:start + TILES_PER_TASK], compress
+
+
+class _MBTiles:
+    def __init__(self, path):
+        path = Path(path)
+        if path.exists():
+            path.unlink()
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+        self.db.execute(
+            "CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+        )
+        self.db.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+
+    def write(self, z, tiles):
+        # MBTiles counts rows from the south (TMS)
+        self.db.executemany(
+            "INSERT INTO tiles VALUES (?, ?, ?, ?)", [(z, x, 2**z - 1 - y, data) for x, y, data in tiles]
+        )
+
+    def close(self, metadata):
+        self.db.executemany("INSERT INTO metadata VALUES (?, ?)", list(metadata.items()))
+        self.db.commit()
+        self.db.close()
+
+
+class _Directory:
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def write(self, z, tiles):
+        for x, y, data in tiles:
+            target = self.path / str(z) / str(x) / f"{y}.pbf"
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(data)
+
+    def close(self, metadata):
+        (self.path / "metadata.json").write_text(json.dumps(metadata, indent=2))
+
+
+def _metadata(layers, name, minzoom, maxzoom, compressed):
+    bounds = np.array([shapely.total_bounds(layer.geometry) for layer in layers if len(layer.geometry)])
+    west, south = coords.transform(bounds[:, 0].min(), bounds[:, 1].min(), WEB_MERCATOR, coords.WGS84)
+    east, north = coords.transform(bounds[:, 2].max(), bounds[:, 3].max(), WEB_MERCATOR, coords.WGS84)
+    vector_layers = [
+        {"id": layer.name, "fields": layer.fields(), "minzoom": max(layer.minzoom, minzoom),
+         "maxzoom": min(layer.maxzoom, maxzoom)}
+        for layer in layers
+    ]
+    return {
+        "name": name,
+        "format": "pbf",
+        "minzoom": str(minzoom),
+        "maxzoom": str(maxzoom),
+        "bounds": f"{float(west):.6f},{float(south):.6f},{float(east):.6f},{float(north):.6f}",
+        "center": f"{(float(west) + float(east)) / 2:.6f},{(float(south) + float(north)) / 2:.6f},{minzoom}",
+        "compression": "gzip" if compressed else "none",
+        "json": json.dumps({"vector_layers": vector_layers}),
+    }
+
+
+def write_tiles(layers, path, minzoom=6, maxzoom=14, name="accidents", workers=None, compress=None):
+    """Write ``layers`` as a vector tile pyramid to ``path``.
+
+    A path ending in ``.mbtiles`` gives an MBTiles file (gzip-compressed
+    tiles), anything else a ``z/x/y.pbf`` directory with a
+    ``metadata.json`` (uncompressed tiles, so that a plain static file
+    server can serve them). Returns the number of tiles per zoom level.
+    """
+    mbtiles = str(path).endswith(".mbtiles")
+    compress = mbtiles if compress is None else compress
+    writer = _MBTiles(path) if mbtiles else _Directory(path)
+    workers = workers or os.cpu_count()
+    written = {}
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for z in range(minzoom, maxzoom + 1):
+            tasks = list(_tasks(layers, z, compress))
+            results = pool.map(_encode_tiles, tasks) if pool else map(_encode_tiles, tasks)
+            written[z] = 0
+            for _, tiles in results:
+                writer.write(z, tiles)
+                written[z] += len(tiles)
+    finally:
+        if pool:
+            pool.shutdown()
+    writer.close(_metadata(layers, name, minzoom, maxzoom, compress))
+    return written
@@ -0,0 +1,110 @@
+"""Parallel snapping over tiles of Switzerland.
+
+The accidents are split into tiles, either per ``CantonCode`` or on a fixed
+LV95 grid. Each tile only gets the edges within ``halo`` metres of its
+bounding box and is snapped in a worker process. An edge closer to a point
+than ``halo`` always lies inside that buffer, so every match found within
+the halo is the true nearest edge. The few points without such a match are
+snapped against the full index afterwards, which keeps the result identical
+to :func:`roadaccidents.snapping.snap`.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from . import coords
+from .snapping import EdgeIndex, SNAP_COLUMNS, snap
+
+
+def tile_ids(accidents, x, y, by="canton", cell_size=20_000):
+    """Return an integer tile id per accident."""
+    if by == "canton":
+        return accidents["CantonCode"].cat.codes.to_numpy("int64")
+    if by == "grid":
+        col = np.floor(x / cell_size).astype("int64")
+        row = np.floor(y / cell_size).astype("int64")
+        return (col - col.min()) * (row.max() - row.min() + 1) + (row - row.min())
+    raise ValueError(f"unknown tiling {by!r}, expected 'canton' or 'grid'")
+
+
+def _snap_tile(task):
+    points, u, v, key, wkb, x, y, max_distance = task
+    edges = pd.DataFrame({"u": u, "v": v, "key": key, "geometry": shapely.from_wkb(wkb)})
+    index = EdgeIndex(edges)
+    point, edge, distance = index.nearest(x, y, max_distance=max_distance)
+    offset = index.offsets(edge, x[point], y[point])
+    return points[point], index.u[edge], index.v[edge], index.key[edge], distance, offset
+
+
+def _tasks(index, tiles, x, y, halo, max_distance):
+    limit = halo if max_distance is None else min(halo, max_distance)
+    order = np.argsort(tiles, kind="stable")
+    bounds = np.flatnonzero(np.r_[True, tiles[order][1:] != tiles[order][:-1], True])
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        points = order[start:stop]
+        if not len(points):
+            continue
+        px, py = x[points], y[points]
+        box = shapely.box(px.min() - halo, py.min() - halo, px.max() + halo, py.max() + halo)
+        edges = np.sort(index.tree_edges[index.tree.query(box)])
+        yield (
+            points,
+            index.u[edges],
+            index.v[edges],
+            index.key[edges],
+            shapely.to_wkb(index.geometry[edges]),
+            px,
+            py,
+            limit,
+        )
+
+
+def merge(results):
+    """Merge per-tile results, keeping the closest edge per accident.
+
+    Ties are broken by ``(u, v, key)`` so the merge does not depend on the
+    order in which the tiles finished.
+    """
+    frame = pd.DataFrame(
+        {name: np.concatenate([r[i] for r in results]) for i, name in enumerate(["point"] + SNAP_COLUMNS)}
+    )
+    frame = frame.sort_values(["point", "distance", "u", "v", "key"], kind="stable")
+    return frame.drop_duplicates("point", keep="first").reset_index(drop=True)
+
+
+def snap_parallel(accidents, index, by="canton", cell_size=20_000, halo=2_000, max_distance=None, workers=None):
+    """Snap accidents like :func:`~roadaccidents.snapping.snap`, tile by tile.
+
+    ``by`` is ``"canton"`` or ``"grid"`` (square LV95 cells of ``cell_size``
+    metres). ``workers`` defaults to the number of CPUs.
+    """
+    x, y = coords.projected_xy(accidents, index.crs)
+    if not len(x):
+        return snap(accidents, index, max_distance=max_distance)
+    tiles = tile_ids(accidents, x, y, by=by, cell_size=cell_size)
+    tasks = sorted(_tasks(index, tiles, x, y, halo, max_distance), key=lambda t: -len(t[0]))
+
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        results = [_snap_tile(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_snap_tile, tasks))
+
+    # points whose nearest edge is farther away than the halo
+    found = np.zeros(len(x), dtype=bool)
+    for r in results:
+        found[r[0]] = True
+    rest = np.flatnonzero(~found)
+    if len(rest) and (max_distance is None or max_distance > halo):
+        point, edge, distance = index.nearest(x[rest], y[rest], max_distance=max_distance)
+        offset = index.offsets(edge, x[rest][point], y[rest][point])
+        results.append((rest[point], index.u[edge], index.v[edge], index.key[edge], distance, offset))
+
+    merged = merge(results) if results else pd.DataFrame(columns=["point"] + SNAP_COLUMNS)
+    uid = accidents["AccidentUID"].to_numpy()[merged["point"].to_numpy("int64")]
+    return merged[SNAP_COLUMNS].set_index(pd.Index(uid, name="AccidentUID"))
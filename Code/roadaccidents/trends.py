@@ -0,0 +1,212 @@
+"""Emerging and diminishing hot spots across the accident years.
+
+The accidents are counted in a location x year cube, where a location is
+either a road edge (from snapping) or an LV95 grid cell. Every statistic is
+computed for all locations at once on that cube:
+
+* Mann-Kendall trend test (with tie correction) and Theil-Sen slope,
+* Poisson regression of the yearly counts on the year (log-linear slope,
+  quasi-Poisson standard error), fitted by vectorized Newton steps,
+* Getis-Ord Gi* per year on sparse spatial weights.
+
+Locations are then classified as ``emerging`` (significant upward trend
+and hot in the last year), ``diminishing`` (significant downward trend,
+hot in earlier years), ``persistent`` (hot in most years without a
+significant trend) or ``none``.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from . import coords
+from .aggregate import accident_edges
+from .hotspots import distance_band, edge_adjacency, gi_star
+from .kde import SWISS_BOUNDS, Grid
+
+CLASSES = ["emerging", "persistent", "diminishing", "none"]
+
+
+def year_cube(group, accidents, n_groups, years=None):
+    """Count accidents per location (row) and year (column).
+
+    ``group`` is the location id per accident (``-1`` to skip it); returns
+    the ``int32`` cube and the list of years.
+    """
+    year = accidents["AccidentYear"].to_numpy("int64")
+    if years is None:
+        years = list(range(int(year.min()), int(year.max()) + 1)) if len(year) else []
+    years = list(years)
+    group = np.asarray(group, dtype="int64")
+    keep = (group >= 0) & (year >= years[0]) & (year <= years[-1]) if years else np.zeros(len(group), bool)
+    flat = group[keep] * len(years) + (year[keep] - years[0])
+    cube = np.bincount(flat, minlength=n_groups * len(years)).reshape(n_groups, len(years))
+    return cube.astype("int32"), years
+
+
+def mann_kendall(cube):
+    """Mann-Kendall ``S``, ``z`` and two-sided ``p`` plus the Theil-Sen slope per row."""
+    x = np.asarray(cube, dtype="float64")
+    n, t = x.shape
+    s = np.zeros(n)
+    slopes = []
+    for lag in range(1, t):
+        diff = x[:, lag:] - x[:, :-lag]
+        s += np.sign(diff).sum(axis=1)
+        slopes.append(diff / lag)
+
+    # tie correction: run lengths of equal values in every sorted row
+    ordered = np.sort(x, axis=1)
+    new = np.ones((n, t), dtype=bool)
+    new[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    run = np.cumsum(new, axis=1) - 1 + np.arange(n)[:, None] * t
+    ties = np.bincount(run.ravel(), minlength=n * t).reshape(n, t)
+    var = (t * (t - 1) * (2 * t + 5) - (ties * (ties - 1) * (2 * ties + 5)).sum(axis=1)) / 18
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(var > 0, (s - np.sign(s)) / np.sqrt(var), 0.0)
+    sen = np.median(np.concatenate(slopes, axis=1), axis=1) if t > 1 else np.zeros(n)
+    return pd.DataFrame({"mk_s": s, "mk_z": z, "mk_p": 2 * norm.sf(np.abs(z)), "sen_slope": sen})
+
+
+def poisson_trend(cube, years, max_iter=30, tol=1e-8):
+    """Log-linear Poisson slope of the yearly counts per row.
+
+    ``slope`` is the change of the log rate per year (``rate_ratio`` its
+    exponential); the standard error is inflated by the Pearson dispersion
+    when the counts are overdispersed. Rows without accidents, and rows
+    whose fit does not converge (e.g. all accidents in a single year at the
+    end of the period), get NaN.
+    """
+    y = np.asarray(cube, dtype="float64")
+    t = np.asarray(years, dtype="float64")
+    t = t - t.mean()
+    n = len(y)
+    total = y.sum(axis=1)
+    a = np.log(np.maximum(total / len(t), 1e-12))
+    b = np.zeros(n)
+    converged = np.zeros(n, dtype=bool)
+    for _ in range(max_iter):
+        mu = np.exp(a[:, None] + b[:, None] * t)
+        g_a = (y - mu).sum(axis=1)
+        g_b = ((y - mu) * t).sum(axis=1)
+        i_aa = mu.sum(axis=1)
+        i_ab = (mu * t).sum(axis=1)
+        i_bb = (mu * t**2).sum(axis=1)
+        det = i_aa * i_bb - i_ab**2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step_a = np.where(det > 0, (i_bb * g_a - i_ab * g_b) / det, 0.0)
+            step_b = np.where(det > 0, (i_aa * g_b - i_ab * g_a) / det, 0.0)
+        a += np.clip(step_a, -5, 5)
+        b += np.clip(step_b, -5, 5)
+        converged = (np.abs(step_a) < tol) & (np.abs(step_b) < tol)
+        if converged.all():
+            break
+
+    mu = np.exp(a[:, None] + b[:, None] * t)
+    i_aa = mu.sum(axis=1)
+    det = i_aa * (mu * t**2).sum(axis=1) - (mu * t).sum(axis=1) ** 2
+    dispersion = ((y - mu) ** 2 / mu).sum(axis=1) / max(len(t) - 2, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        se = np.sqrt(i_aa / det * np.maximum(dispersion, 1.0))
+    ok = converged & (total > 0) & (det > 0)
+    slope = np.where(ok, b, np.nan)
+    se = np.where(ok, se, np.nan)
+    z = slope / se
+    return pd.DataFrame({
+        "poisson_slope": slope,
+        "poisson_se": se,
+        "poisson_p": 2 * norm.sf(np.abs(z)),
+        "rate_ratio": np.exp(slope),
+    })
+
+
+def trends(cube, years, weights, alpha=0.05, z_hot=1.96, persistent_share=0.9):
+    """Trend statistics and classification for every row of ``cube``.
+
+    ``weights`` are the sparse spatial weights between the rows (see
+    :mod:`roadaccidents.hotspots`). Returns the per-location table and the
+    Gi* z-scores per year. The trend tests are only run on rows with at
+    least one accident; empty rows are ``none``.
+    """
+    cube = np.asarray(cube)
+    labels = [f"y{year}" for year in years]
+    gi = pd.DataFrame(gi_star(cube, weights), columns=labels)
+    hot = gi.to_numpy() >= z_hot
+
+    total = cube.sum(axis=1)
+    active = np.flatnonzero(total > 0)
+    mk = mann_kendall(cube[active]).set_index(active)
+    poisson = poisson_trend(cube[active], years).set_index(active)
+    table = pd.concat([mk, poisson], axis=1).reindex(np.arange(len(cube)))
+    table.insert(0, "accidents", total)
+    table["hot_years"] = hot.sum(axis=1)
+    table["gi_last"] = gi[labels[-1]].to_numpy()
+
+    significant = (table["mk_p"] < alpha).to_numpy()
+    up = significant & (table["mk_s"] > 0).to_numpy()
+    down = significant & (table["mk_s"] < 0).to_numpy()
+    trend = np.full(len(cube), "none", dtype=object)
+    trend[(hot.sum(axis=1) >= persistent_share * len(years)) & ~significant] = "persistent"
+    trend[down & hot[:, :-1].any(axis=1)] = "diminishing"
+    trend[up & hot[:, -1]] = "emerging"
+    table["trend"] = pd.Categorical(trend, categories=CLASSES)
+    return table, gi
+
+
+def edge_trends(snapped, accidents, index, years=None, **kwargs):
+    """Run :func:`trends` per edge of an :class:`~roadaccidents.snapping.EdgeIndex`.
+
+    Edges are neighbours when they share a node. Of the two directed edges
+    of a two-way street only the one accidents are snapped to
+    (``index.tree_edges``) is a location; its always empty twin would
+    lower the Gi* mean and the spatial lags.
+    """
+    ids = index.edges[["u", "v", "key"]].iloc[index.tree_edges].reset_index(drop=True)
+    edge = accident_edges(snapped, accidents, ids)
+    cube, years = year_cube(edge, accidents, len(ids), years)
+    weights = edge_adjacency(index.u[index.tree_edges], index.v[index.tree_edges])
+    table, gi = trends(cube, years, weights, **kwargs)
+    table = pd.concat([ids, table], axis=1).rename_axis("edge")
+    return table, gi.rename_axis("edge")
+
+
+def grid_cells(accidents, grid, band):
+    """Return the cell id per accident and the cells within ``band`` of any accident.
+
+    Empty cells next to accidents are kept so that Gi* sees the zeros
+    around a hot spot; empty cells far from any accident (lakes, glaciers)
+    are left out.
+    """
+    row, col = grid.cell_index(*coords.lv95_xy(accidents))
+    inside = row >= 0
+    occupied = np.unique(row[inside] * grid.nx + col[inside])
+    reach = int(np.ceil(band / grid.cell))
+    dr, dc = np.meshgrid(np.arange(-reach, reach + 1), np.arange(-reach, reach + 1), indexing="ij")
+    near = (dr**2 + dc**2) * grid.cell**2 <= band**2
+    dr, dc = dr[near], dc[near]
+    r = (occupied // grid.nx)[:, None] + dr[None, :]
+    c = (occupied % grid.nx)[:, None] + dc[None, :]
+    valid = (r >= 0) & (r < grid.ny) & (c >= 0) & (c < grid.nx)
+    cells = np.unique(r[valid] * grid.nx + c[valid])
+
+    group = np.full(len(row), -1, dtype="int64")
+    group[inside] = np.searchsorted(cells, row[inside] * grid.nx + col[inside])
+    xc, yc = grid.centers()
+    frame = pd.DataFrame({
+        "row": cells // grid.nx,
+        "col": cells % grid.nx,
+        "x": xc[cells % grid.nx],
+        "y": yc[cells // grid.nx],
+    })
+    return group, frame.rename_axis("cell")
+
+
+def grid_trends(accidents, cell=500.0, band=1_000.0, bounds=SWISS_BOUNDS, years=None, **kwargs):
+    """Run :func:`trends` per LV95 grid cell, with a distance band of ``band`` metres."""
+    grid = Grid.from_bounds(bounds, cell)
+    group, cells = grid_cells(accidents, grid, band)
+    cube, years = year_cube(group, accidents, len(cells), years)
+    weights = distance_band(cells["x"].to_numpy(), cells["y"].to_numpy(), band * (1 + 1e-9))
+    table, gi = trends(cube, years, weights, **kwargs)
+    return pd.concat([cells, table.set_index(cells.index)], axis=1), gi.set_index(cells.index)
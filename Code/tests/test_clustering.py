@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from roadaccidents import clustering, coords
+
+sklearn_cluster = pytest.importorskip("sklearn.cluster")
+metrics = pytest.importorskip("sklearn.metrics")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+from hdbscan_sklearn import sample  # noqa: E402
+
+
+def frame(X):
+    return pd.DataFrame({coords.LV95_E: X[:, 0], coords.LV95_N: X[:, 1]})
+
+
+@pytest.mark.parametrize("n", [4_000, 20_000])
+def test_hdbscan_matches_sklearn(n):
+    accidents, X = sample(n)
+    ours = clustering.hdbscan(accidents, min_cluster_size=20)
+    theirs = sklearn_cluster.HDBSCAN(min_cluster_size=20).fit(X).labels_
+    assert metrics.adjusted_rand_score(ours, theirs) >= 0.95
+
+
+def test_hdbscan_joins_disconnected_groups():
+    rng = np.random.default_rng(0)
+    centres = [(0, 0), (2_000, 0), (0, 3_000), (40_000, 40_000)]
+    X = np.vstack([rng.normal(c, 30, (150, 2)) for c in centres]) + 2_600_000
+    ours = clustering.hdbscan(frame(X), min_cluster_size=20, n_neighbors=5)
+    theirs = sklearn_cluster.HDBSCAN(min_cluster_size=20).fit(X).labels_
+    assert metrics.adjusted_rand_score(ours, theirs) >= 0.95
+
+
+def test_dbscan_matches_sklearn():
+    accidents, X = sample(4_000)
+    X = np.round(X)
+    accidents[coords.LV95_E], accidents[coords.LV95_N] = X[:, 0], X[:, 1]
+    ours = clustering.dbscan(accidents, eps=30, min_samples=10)
+    theirs = sklearn_cluster.DBSCAN(eps=30, min_samples=10).fit(X)
+    core = np.zeros(len(X), dtype=bool)
+    core[theirs.core_sample_indices_] = True
+    np.testing.assert_array_equal(ours < 0, theirs.labels_ < 0)
+    assert metrics.adjusted_rand_score(ours[core], theirs.labels_[core]) == 1.0
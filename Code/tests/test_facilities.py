@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from roadaccidents import coords, facilities, synthetic
+
+gpd = pytest.importorskip("geopandas")
+
+
+@pytest.fixture(scope="module")
+def layers():
+    rng = np.random.default_rng(1)
+    accidents = synthetic.accidents(500, seed=1)
+    x, y = coords.lv95_xy(accidents)
+    box = (x.min(), y.min(), x.max(), y.max())
+    stops = gpd.GeoDataFrame(
+        geometry=shapely.points(rng.uniform(box[0], box[2], 60), rng.uniform(box[1], box[3], 60)),
+        index=pd.Index(np.arange(60) + 1000, name="id"),
+        crs=coords.LV95,
+    ).to_crs(coords.WGS84)
+    schools = gpd.GeoDataFrame(
+        geometry=shapely.buffer(shapely.points(rng.uniform(box[0], box[2], 20), rng.uniform(box[1], box[3], 20)), 30),
+        index=pd.Index([f"s{i}" for i in range(20)], name="name"),
+        crs=coords.LV95,
+    )
+    return accidents, stops, schools
+
+
+def brute_force(sources, facilities_, max_distance):
+    distance = shapely.distance(sources[:, None], facilities_[None, :])
+    item = distance.argmin(axis=1)
+    best = distance[np.arange(len(sources)), item]
+    return np.where(best <= max_distance, item, -1), np.where(best <= max_distance, best, np.nan)
+
+
+@pytest.mark.parametrize("layer", ["stop", "school"])
+def test_nearest_facility_matches_brute_force(layers, layer):
+    accidents, stops, schools = layers
+    target = {"stop": stops, "school": schools}[layer]
+    result = facilities.nearest_facility(accidents, target, max_distance=2_000, name=layer)
+    item, distance = brute_force(facilities.geometries(accidents), facilities.geometries(target), 2_000)
+    np.testing.assert_allclose(result[f"{layer}_distance"].to_numpy(), distance, equal_nan=True)
+    expected = pd.array(target.index.to_numpy()).take(item, allow_fill=True)
+    pd.testing.assert_extension_array_equal(result[layer].array, expected, check_dtype=False)
+    assert result.index.equals(pd.Index(accidents["AccidentUID"].to_numpy(), name="AccidentUID"))
+
+
+def test_polygon_sources(layers):
+    accidents, stops, _ = layers
+    buildings = shapely.buffer(facilities.geometries(accidents)[:50], 5)
+    result = facilities.nearest_facility(buildings, stops, name="stop")
+    _, distance = brute_force(buildings, facilities.geometries(stops), np.inf)
+    np.testing.assert_allclose(result["stop_distance"].to_numpy(), distance)
+
+
+def test_empty_facilities_keep_ids():
+    stops = gpd.GeoDataFrame(
+        geometry=[shapely.Point(), None, shapely.Point(0, 0), shapely.Point(100, 0)],
+        index=pd.Index([10, 20, 30, 40]),
+    )
+    sources = np.array([shapely.Point(90, 0), shapely.Point(1, 1), None, shapely.Point()], dtype=object)
+    result = facilities.nearest_facility(sources, stops)
+    assert result["facility"].dtype == "Int64"
+    assert result["facility"].tolist()[:2] == [40, 30]
+    assert result["facility"].isna().tolist() == [False, False, True, True]
+
+
+@pytest.mark.parametrize("mode", ["walk", "drive"])
+def test_network_distance_matches_networkx(mode):
+    nx = pytest.importorskip("networkx")
+    from scipy.spatial import cKDTree
+
+    from roadaccidents.csrgraph import CSRGraph
+
+    rng = np.random.default_rng(3)
+    graph = synthetic.road_graph(30, 100.0)
+    # a third of the streets one-way
+    keep = np.flatnonzero(rng.random(graph.n_edges) > 0.3)
+    graph = CSRGraph._build(
+        graph.osmid, graph.x, graph.y, graph.u[keep].astype("int64"), graph.v[keep].astype("int64"),
+        graph.key[keep].astype("int64"), graph.length[keep],
+        np.asarray(graph.highway_labels, dtype=object)[graph.highway[keep]], graph.geometries(keep), graph.crs,
+    )
+    accidents = synthetic.accidents(300, graph, seed=1)
+    fx = rng.uniform(graph.x.min(), graph.x.max(), 10)
+    fy = rng.uniform(graph.y.min(), graph.y.max(), 10)
+    schools = gpd.GeoDataFrame(geometry=shapely.points(fx, fy), index=[f"f{i}" for i in range(10)], crs=graph.crs)
+    result = facilities.network_distance(accidents, schools, graph, mode=mode, name="school")
+
+    # Dijkstra from the facilities, on the reversed graph when driving
+    G = nx.DiGraph() if mode == "drive" else nx.Graph()
+    for u, v, length in zip(graph.u.tolist(), graph.v.tolist(), graph.length.tolist()):
+        tail, head = (v, u) if mode == "drive" else (u, v)
+        if not G.has_edge(tail, head) or G[tail][head]["w"] > length:
+            G.add_edge(tail, head, w=max(length, 1e-6))
+    tree = cKDTree(np.column_stack([graph.x, graph.y]))
+    snap, node = tree.query(np.column_stack([fx, fy]))
+    for i, (n, d) in enumerate(zip(node.tolist(), snap)):
+        G.add_edge(("f", i), n, w=max(d, 1e-6))
+    reach = nx.multi_source_dijkstra_path_length(G, [("f", i) for i in range(10)], weight="w")
+    snap, node = tree.query(np.column_stack(coords.lv95_xy(accidents)))
+    expected = np.array([reach.get(n, np.nan) + d for n, d in zip(node.tolist(), snap)])
+    np.testing.assert_allclose(result["school_distance"].to_numpy(), expected, rtol=1e-9, equal_nan=True)
+
+    limited = facilities.network_distance(accidents, schools, graph, mode=mode, max_distance=500)
+    beyond = ~(expected <= 500)
+    assert limited["facility"].isna().to_numpy().tolist() == beyond.tolist()
+    assert np.isnan(limited["facility_distance"].to_numpy()[beyond]).all()
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import shapely
+
+from roadaccidents import coords
+
+gpd = pytest.importorskip("geopandas")
+geofabrik = pytest.importorskip("roadaccidents.geofabrik")
+
+LUCERNE = shapely.box(8.27, 47.03, 8.33, 47.07)
+
+
+@pytest.fixture(scope="module")
+def buildings(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    n = 5_000
+    lon = rng.uniform(8.2, 8.4, n)
+    lat = rng.uniform(47.0, 47.1, n)
+    gdf = gpd.GeoDataFrame(
+        {
+            "osm_id": np.arange(n).astype(str),
+            "code": 1500,
+            "fclass": "building",
+            "type": rng.choice(["house", "church", "school", "apartments"], n),
+        },
+        geometry=shapely.box(lon, lat, lon + 2e-4, lat + 1.5e-4),
+        crs=coords.WGS84,
+    )
+    directory = tmp_path_factory.mktemp("geofabrik")
+    gdf.to_file(directory / "gis_osm_buildings_a_free_1.shp")
+    return directory, gdf
+
+
+def test_read_region_matches_geopandas(buildings, tmp_path):
+    directory, gdf = buildings
+    assert geofabrik.import_geofabrik(directory, tmp_path) == ["buildings_a"]
+    assert geofabrik.import_geofabrik(directory, tmp_path) == []
+
+    region = geofabrik.read_region(tmp_path, "buildings_a", polygon=LUCERNE, crs=coords.WGS84, predicate="within")
+    assert sorted(region["osm_id"]) == sorted(gdf.loc[gdf.within(LUCERNE), "osm_id"])
+
+    filtered = geofabrik.read_region(
+        tmp_path, "buildings_a", polygon=LUCERNE, crs=coords.WGS84, columns=["osm_id", "type"],
+        type=["church", "school"],
+    )
+    expected = gdf[gdf.intersects(LUCERNE) & gdf["type"].isin(["church", "school"])]
+    assert sorted(filtered["osm_id"]) == sorted(expected["osm_id"])
+    assert set(filtered.columns) == {"osm_id", "type", "geometry"}
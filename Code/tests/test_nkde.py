@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from roadaccidents import nkde, synthetic
+from roadaccidents.snapping import snap
+
+nx = pytest.importorskip("networkx")
+
+BANDWIDTH = 250.0
+LIXEL = 20.0
+
+
+@pytest.fixture(scope="module")
+def case():
+    graph = synthetic.road_graph(15, 80.0, seed=1)
+    accidents = synthetic.accidents(60, graph, seed=2)
+    snapped = snap(accidents, graph.to_edge_index())
+    return snapped, accidents, nkde.LixelNetwork(graph, LIXEL)
+
+
+def brute_force(snapped, accidents, network):
+    """Quartic kernel density per lixel centre, distances from networkx Dijkstra."""
+    edge, position = network.locate(snapped, accidents)
+    G = nx.Graph()
+    for e in range(network.n_edges):
+        G.add_edge(int(network.a[e]), int(network.b[e]), weight=network.length[e])
+    lixels = network.lixels()
+    target = lixels["edge"].to_numpy()
+    centre = (lixels["start"].to_numpy() + lixels["end"].to_numpy()) / 2
+    a, b, length = network.a[target], network.b[target], network.length[target]
+
+    density = np.zeros(len(lixels))
+    for e, t in zip(edge, position):
+        from_a = nx.single_source_dijkstra_path_length(G, int(network.a[e]), cutoff=2 * BANDWIDTH)
+        from_b = nx.single_source_dijkstra_path_length(G, int(network.b[e]), cutoff=2 * BANDWIDTH)
+
+        def to_node(nodes):
+            return np.array([
+                min(t + from_a.get(int(n), np.inf), network.length[e] - t + from_b.get(int(n), np.inf)) for n in nodes
+            ])
+
+        distance = np.minimum(to_node(a) + centre, to_node(b) + length - centre)
+        same = target == e
+        distance[same] = np.minimum(distance[same], np.abs(centre[same] - t))
+        u = distance / BANDWIDTH
+        density += np.where(u < 1, 15 / 16 * (1 - u**2) ** 2 / BANDWIDTH, 0)
+    return density * 1000
+
+
+def test_density_matches_networkx(case):
+    density = nkde.network_density(*case, bandwidth=BANDWIDTH, workers=1, cell_size=800)
+    np.testing.assert_allclose(density, brute_force(*case), rtol=1e-6, atol=1e-9)
+
+
+def test_density_does_not_depend_on_tiles(case):
+    one = nkde.network_density(*case, bandwidth=BANDWIDTH, workers=1, cell_size=800)
+    many = nkde.network_density(*case, bandwidth=BANDWIDTH, workers=1, cell_size=300, chunk=7)
+    np.testing.assert_allclose(one, many, rtol=1e-9, atol=1e-12)
@@ -0,0 +1,56 @@
+from unittest import mock
+
+import pandas as pd
+import pytest
+
+from roadaccidents import refresh, synthetic
+
+
+@pytest.fixture(scope="module")
+def network():
+    graph = synthetic.road_graph(30, 80.0)
+    return graph, graph.to_edge_index()
+
+
+def assert_same_state(a, b):
+    left, right = refresh.load_aggregates(a), refresh.load_aggregates(b)
+    assert left.keys() == right.keys()
+    for level in left:
+        pd.testing.assert_frame_equal(left[level], right[level])
+
+
+def test_incremental_equals_full(tmp_path, network):
+    graph, index = network
+    accidents = synthetic.accidents(3000, graph, seed=2)
+    previous = accidents[accidents["AccidentYear"] < 2020].reset_index(drop=True)
+    # a corrected record and a withdrawn one
+    previous.loc[0, "AccidentHour"] = (previous.loc[0, "AccidentHour"] + 1) % 24
+    latest = accidents.drop(index=5).reset_index(drop=True)
+
+    refresh.refresh(previous, tmp_path / "incremental", index)
+    summary = refresh.refresh(latest, tmp_path / "incremental", index)
+    refresh.refresh(latest, tmp_path / "full", index)
+
+    assert not summary["full"]
+    assert summary["changed"] == 1 and summary["removed"] == 1
+    assert summary["new"] == int((latest["AccidentYear"] >= 2020).sum())
+    assert_same_state(tmp_path / "incremental", tmp_path / "full")
+
+
+def test_failed_refresh_keeps_state(tmp_path, network):
+    graph, index = network
+    accidents = synthetic.accidents(1000, graph, seed=3)
+    previous = accidents[accidents["AccidentYear"] < 2020].reset_index(drop=True)
+    refresh.refresh(previous, tmp_path / "state", index)
+    refresh.refresh(previous, tmp_path / "reference", index)
+
+    with mock.patch.object(pd.DataFrame, "to_parquet", side_effect=[None, OSError("disk full")]):
+        with pytest.raises(OSError):
+            refresh.refresh(accidents, tmp_path / "state", index)
+    assert_same_state(tmp_path / "state", tmp_path / "reference")
+
+    # the next run starts from the old state and is not counted twice
+    refresh.refresh(accidents, tmp_path / "state", index)
+    refresh.refresh(accidents, tmp_path / "reference", index)
+    assert_same_state(tmp_path / "state", tmp_path / "reference")
+    assert not (tmp_path / "state.new").exists()